@@ -1,10 +1,11 @@
+import os
+import tempfile
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-from tqdm import tqdm
 
 from getPoints import Mocap, Openpose3d
-from icp import ICP
+from icp import ICP, BatchICP, loadJointMap
 
 SKIP_OPT_CAP_FRAME = 36
 
@@ -36,107 +37,252 @@ FRAME_RANGE = 100
 FRAME_PER_STEP = 2
 frame_idx = [x for x in scheduler(FRAME_RANGE, FRAME_PER_STEP)]
 
+## first grid of the coarse-to-fine search (--search coarse)
+COARSE_PER_STEP = 16
+
 SCALE_RANGE = 120*4
 SCALE_PER_STEP = 8*4
 scale_idx = [x for x in scheduler(SCALE_RANGE, SCALE_PER_STEP)]
 
-mocap = Mocap(MOCAP_CONF)
-mocap.importData()
-openpose = Openpose3d(OPENPOSE_CONF)
-
-cost = np.zeros(len(frame_idx))
-
-steps_report = tqdm(total = len(frame_idx))
-step_counter = 0
-min_val = 10e+5
-min_idx = [-1, -1]
-
-
-### Search
-for i, f_idx in enumerate(frame_idx):
-    ## MoCap
-    tX=[None]*FRAME_CONF['FRAME_NUM']
-    tY=[None]*FRAME_CONF['FRAME_NUM'] 
-    tZ=[None]*FRAME_CONF['FRAME_NUM']
-    for idx, m_fc in enumerate(FRAME_CONF['MOCAP_IDX']):
-        tX[idx], tY[idx], tZ[idx] = mocap.loadPoints(int(m_fc*SKIP_OPT_CAP_FRAME)+f_idx, 0)
-
-    X = np.concatenate(tX).flatten()
-    Y = np.concatenate(tY).flatten()
-    Z = np.concatenate(tZ).flatten()
-    mc_points = np.stack([X, Y, Z]).T.copy()
-
-    ## OpenPose
-    tX=[None]*FRAME_CONF['FRAME_NUM']
-    tY=[None]*FRAME_CONF['FRAME_NUM']
-    tZ=[None]*FRAME_CONF['FRAME_NUM']
-    for idx, o_fc in enumerate(FRAME_CONF['OP_IDX']):
-        tX[idx], tY[idx], tZ[idx] = openpose.loadPoints(o_fc)
-    X = np.concatenate(tX).flatten()
-    Y = np.concatenate(tY).flatten()
-    Z = np.concatenate(tZ).flatten()
-    op_points = np.stack([X, Y, Z]).T.copy()
+## (offsets, keyframes*62, 3) mocap points of the keyframes for every offset in [-scope, scope],
+## gathered from the memory-mapped data at once. the points of offset f_idx are store[f_idx + scope].
+def loadMocapStore(scope):
+    offsets = np.arange(-scope, scope + 1)
+    rows = (np.array(FRAME_CONF['MOCAP_IDX']) * SKIP_OPT_CAP_FRAME)[None, :] + offsets[:, None]
+    points = mocap.loadFrames(rows).astype('float64')
+    return points.reshape(len(offsets), -1, 3)
+
+## (keyframes*62, 3) mocap points of the keyframes shifted by f_idx (no file access, see loadMocapStore)
+def loadMocapPoints(f_idx):
+    return mocap_store[int(f_idx) + FRAME_RANGE]
+
+## (keyframes*25, 3) openpose points of the keyframes
+def loadOpenposePoints():
+    return openpose.loadFrames(np.array(FRAME_CONF['OP_IDX'])).reshape(-1, 3)
+
+## ICP costs and transformations of the frame offsets f_idxs
+## known: {offset: 4x4 transformation} of solved offsets. if given (warm start), the offsets are solved
+## one by one, each starting from the transformation of the nearest solved offset.
+## options:
+##   swap      : align the mocap points to the constant openpose points instead, so that a single KD-tree
+##               of the openpose keyframes is shared by all offsets (the pairing direction is reversed).
+##   joint_map : solve each offset in closed form with the known openpose joint -> mocap marker(s) map,
+##               followed by `refine` iterations of nearest-neighbour ICP.
+##   robust    : outlier handling of the ICP correspondences (see icp.DEFAULT_ROBUST).
+def solveOffsets(args):
+    f_idxs, op_points, known, options = args
+    swap, robust = options['swap'], options['robust']
+
+    if options['joint_map'] is not None:
+        mc_points = mocap_store[np.asarray(f_idxs) + FRAME_RANGE]
+
+        ## icp = BatchICP(dst, src)
+        icp = BatchICP(mc_points, op_points, robust=robust)
+        transforms = icp.icp_correspond(options['joint_map'], FRAME_CONF['FRAME_NUM'], refine=options['refine'])
+        if options['refine'] > 0:
+            return icp.calc_icpcost(), transforms
+        return icp.correspond_cost, transforms
+
+    if known is None:
+        ## mc_points (offsets, keyframes*62, 3)
+        mc_points = mocap_store[np.asarray(f_idxs) + FRAME_RANGE]
+
+        ## icp = BatchICP(dst, src)
+        icp = BatchICP(op_points, mc_points, robust=robust) if swap else BatchICP(mc_points, op_points, robust=robust)
+        transforms = icp.icp_calculate_s(100)
+        return icp.calc_icpcost(), transforms
+
+    known = dict(known)
+    remaining = [int(x) for x in f_idxs]
+    cost = {}
+    while remaining:
+        if known:
+            f_idx, nearest = min(((x, k) for x in remaining for k in known), key=lambda p: abs(p[0] - p[1]))
+            init = known[nearest]
+        else:
+            f_idx, init = remaining[0], None
+
+        ## icp = ICP(dst, src)
+        icp = ICP(op_points, loadMocapPoints(f_idx), robust=robust) if swap else ICP(loadMocapPoints(f_idx), op_points, robust=robust)
+        known[f_idx] = icp.icp_calculate_s(100, init=init)
+        cost[f_idx] = icp.calc_icpcost()
+        remaining.remove(f_idx)
+
+    return np.array([cost[int(x)] for x in f_idxs]), np.array([known[int(x)] for x in f_idxs])
+
+## the workers memory-map the preloaded mocap points from a file instead of receiving a pickled copy.
+def saveMocapStore(store, dirname):
+    path = os.path.join(dirname, 'mocap_store.npy')
+    np.save(path, store)
+    return path
+
+def initWorker(store_path):
+    global mocap_store
+    mocap_store = np.load(store_path, mmap_mode='r')
+
+## ICP cost of each frame offset, solved on demand and memoized.
+## the offsets of one call are split into chunks and solved by BatchICP (over the pool, if given).
+## with warm_start, each chunk is chained from the transformations already solved.
+class OffsetCost(object):
+    def __init__(self, op_points, pool=None, num_chunks=1, warm_start=False, swap=False, joint_map=None, refine=0, robust=None):
+        self.op_points = op_points
+        self.pool = pool
+        self.num_chunks = num_chunks
+        self.warm_start = warm_start
+        self.options = {'swap': swap, 'joint_map': joint_map, 'refine': refine, 'robust': robust}
+        self.costs = {}
+        self.transforms = {}
+
+    def __call__(self, offsets):
+        offsets = [int(x) for x in offsets]
+        new_offsets = sorted(set(offsets) - set(self.costs))
+
+        if new_offsets:
+            num_chunks = min(self.num_chunks, len(new_offsets))
+            known = self.transforms if self.warm_start else None
+            chunks = [(c, self.op_points, known, self.options) for c in np.array_split(np.array(new_offsets), num_chunks)]
+            if self.pool is not None:
+                results = self.pool.map(solveOffsets, chunks)
+            else:
+                results = [solveOffsets(c) for c in chunks]
+            self.costs.update(zip(new_offsets, np.concatenate([r[0] for r in results])))
+            self.transforms.update(zip(new_offsets, np.concatenate([r[1] for r in results])))
+
+        return np.array([self.costs[x] for x in offsets])
+
+    ## number of ICP solves so far
+    def solves(self):
+        return len(self.costs)
+
+    def best(self):
+        return min(self.costs, key=self.costs.get)
+
+## dense search on the uniform grid
+def searchGrid(evaluate):
+    evaluate(frame_idx)
+    return evaluate.best()
+
+## coarse grid, then halve the step around the best offset down to a single mocap frame
+def searchCoarse(evaluate, scope, steps):
+    offsets = scheduler(scope, steps)
+    evaluate(offsets[np.abs(offsets) <= scope])
+
+    best = evaluate.best()
+    while steps > 1:
+        steps = steps // 2
+        evaluate([x for x in (best - steps, best + steps) if abs(x) <= scope])
+        best = evaluate.best()
+
+    return best
+
+## golden-section search on the integer offsets (assumes an unimodal cost curve in the range).
+## the bracket [a, b] holds two interior probes c < d; each step keeps the probe on the better side with its
+## cost and evaluates only one new probe. once the bracket is 4 frames or less, all of it is evaluated.
+def searchGolden(evaluate, scope):
+    invphi = (np.sqrt(5) - 1) / 2
+    a, b = -scope, scope
+    c, d = b - int(round((b - a) * invphi)), a + int(round((b - a) * invphi))
+    cost_c, cost_d = evaluate([c, d])
+
+    while b - a > 4:
+        if cost_c < cost_d:
+            b, d, cost_d = d, c, cost_c
+            c = min(b - int(round((b - a) * invphi)), d - 1)
+            cost_c = evaluate([c])[0]
+        else:
+            a, c, cost_c = c, d, cost_d
+            d = max(a + int(round((b - a) * invphi)), c + 1)
+            cost_d = evaluate([d])[0]
+
+    evaluate(range(a, b + 1))
+    return evaluate.best()
+
+## sub-frame offset from the parabola through the costs of best-1, best, best+1
+def refineSubframe(evaluate, best, scope):
+    if abs(best) >= scope:
+        return float(best)
+
+    c0, c1, c2 = evaluate([best - 1, best, best + 1])
+    denom = c0 - 2 * c1 + c2
+    if denom <= 0:
+        return float(best)
+
+    return best + 0.5 * (c0 - c2) / denom
+
+## main
+if __name__ == '__main__':
+    import argparse
+    from contextlib import nullcontext
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--workers', help='number of worker processes for the offset search', type=int, default=1)
+    parser.add_argument('-s', '--search', help='offset search strategy', choices=['grid', 'coarse', 'golden'], default='grid')
+    parser.add_argument('--warm-start', help='start ICP from the solution of the nearest solved offset', action='store_true')
+    parser.add_argument('--swap', help='align mocap to openpose, sharing one KD-tree of the openpose keyframes', action='store_true')
+    parser.add_argument('--joint-map', help='json file of openpose joint -> mocap marker(s), solves offsets in closed form')
+    parser.add_argument('--refine', help='nearest-neighbour ICP iterations after the closed-form solve (with --joint-map)', type=int, default=0)
+    parser.add_argument('--robust', help='outlier handling of the ICP correspondences', choices=['trim', 'threshold', 'huber'])
+    parser.add_argument('--robust-param', help='kept fraction (trim) or distance (threshold, huber)', type=float)
+    args = parser.parse_args()
+    if args.robust and args.robust_param is None:
+        parser.error('--robust {} needs --robust-param'.format(args.robust))
+    if args.joint_map and (args.warm_start or args.swap):
+        parser.error('--joint-map solves each offset in closed form, it cannot be used with --warm-start or --swap')
+
+    mocap = Mocap(MOCAP_CONF)
+    mocap.importData()
+    openpose = Openpose3d(OPENPOSE_CONF)
+
+
+    ### Search
+    ## all keyframes of all offsets are loaded once; the search runs on these arrays only.
+    mocap_store = loadMocapStore(FRAME_RANGE)
+    op_points = loadOpenposePoints()
+
+    joint_map = loadJointMap(args.joint_map) if args.joint_map else None
+    robust = {'method': args.robust, 'param': args.robust_param} if args.robust else None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        initargs = (saveMocapStore(mocap_store, tmp_dir),) if args.workers > 1 else ()
+        with (Pool(args.workers, initializer=initWorker, initargs=initargs) if args.workers > 1 else nullcontext()) as pool:
+            evaluate = OffsetCost(op_points, pool=pool, num_chunks=max(1, args.workers), warm_start=args.warm_start,
+                                  swap=args.swap, joint_map=joint_map, refine=args.refine, robust=robust)
+
+            if args.search == 'coarse':
+                min_idx = searchCoarse(evaluate, FRAME_RANGE, COARSE_PER_STEP)
+            elif args.search == 'golden':
+                min_idx = searchGolden(evaluate, FRAME_RANGE)
+            else:
+                min_idx = searchGrid(evaluate)
+            sub_idx = refineSubframe(evaluate, min_idx, FRAME_RANGE)
+
+    offsets = sorted(evaluate.costs)
+    cost = np.array([evaluate.costs[x] for x in offsets])
+    min_val = evaluate.costs[min_idx]
+
+    print('min_cost:', min_val, 'min_idx.frame:', min_idx, 'sub-frame:', sub_idx)
+    print('search:', args.search, 'icp solves:', evaluate.solves())
+
+    plt.plot(offsets, cost, '.-')
+    plt.xlabel("Frame")
+    plt.ylabel("Cost")
+    plt.grid(True)
+    plt.show()
+
+
+    f_idx = min_idx
+
+    ## opt-mocap
+    mc_points = loadMocapPoints(f_idx)
+
+    ## mv-OpenPose
+    op_points = loadOpenposePoints()
 
     ## icp = ICP(dst, src)
-    icp = ICP(mc_points, op_points)
+    icp = ICP(mc_points, op_points, configs=FRAME_CONF, robust=robust)
     icp.icp_calculate_s(100)
-
     icp_cost = icp.calc_icpcost()
-    cost[i] = icp_cost
-
-    if icp_cost < min_val:
-        min_val = icp_cost
-        min_idx = f_idx
-        min_step = step_counter
-
-    steps_report.update(1)
-    step_counter += 1
-
-print('min_cost:', min_val, 'step, min_idx.frame:', min_step, min_idx)
-
-plt.plot(frame_idx, cost)
-plt.xlabel("Frame")
-plt.ylabel("Cost")
-plt.grid(True)
-plt.show()
-
-
-f_idx = min_idx
-
-## opt-mocap
-tX=[None]*FRAME_CONF['FRAME_NUM']
-tY=[None]*FRAME_CONF['FRAME_NUM'] 
-tZ=[None]*FRAME_CONF['FRAME_NUM']
-for idx, m_fc in enumerate(FRAME_CONF['MOCAP_IDX']):
-    tX[idx], tY[idx], tZ[idx] = mocap.loadPoints(int(m_fc*SKIP_OPT_CAP_FRAME)+f_idx, 0)
-
-X = np.concatenate(tX).flatten()
-Y = np.concatenate(tY).flatten()
-Z = np.concatenate(tZ).flatten()
-mc_points = np.stack([X, Y, Z]).T.copy()
-
-## mv-OpenPose
-tX=[None]*FRAME_CONF['FRAME_NUM']
-tY=[None]*FRAME_CONF['FRAME_NUM']
-tZ=[None]*FRAME_CONF['FRAME_NUM']
-for idx, o_fc in enumerate(FRAME_CONF['OP_IDX']):
-    tX[idx], tY[idx], tZ[idx] = openpose.loadPoints(o_fc)
-X = np.concatenate(tX).flatten()
-Y = np.concatenate(tY).flatten()
-Z = np.concatenate(tZ).flatten()
-op_points = np.stack([X, Y, Z]).T.copy()
-
-## icp = ICP(dst, src)
-icp = ICP(mc_points, op_points, configs=FRAME_CONF)
-icp.icp_calculate_s(100)
-icp_cost = icp.calc_icpcost()
-
-print("icp_cost:", icp_cost)
-icp.graph_plot(isSave=False)  # <- draw a graph
-
-
-
-            
-
 
-            
\ No newline at end of file
+    print("icp_cost:", icp_cost, "inlier_ratio:", icp.inlier_ratio)
+    icp.graph_plot(isSave=False)  # <- draw a graph
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+
+from getPoints import Mocap, Openpose3d
+from frameSync import estimateFrameSync, saveFrameSync, getSignal, resample, SYNC_FILE
+
+MOCAP_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/opt-mocap',
+    'DATASET_FILE' : 'optmocap.trc',
+    'JOINT_IDX' : 29,
+}
+
+OPENPOSE_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/mv-openpose/3dpose',
+    'JOINT_IDX' : 8,
+    'FRAME_NUM' : 750
+}
+
+## grid of mocap frames per openpose frame
+SCALE_MIN = 20
+SCALE_MAX = 60
+SCALE_PER_STEP = 1
+
+## main
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--signal', help='1-D signal of the joints compared', choices=['speed', 'height'], default='speed')
+    parser.add_argument('--scales', help='grid of mocap frames per openpose frame: min max step', type=float, nargs=3,
+                        default=[SCALE_MIN, SCALE_MAX, SCALE_PER_STEP])
+    parser.add_argument('--min_overlap', help='minimum overlap of the openpose signal (ratio)', type=float, default=0.5)
+    parser.add_argument('--no_save', help='do not save the mapping to ' + SYNC_FILE, action='store_true')
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+
+    mocap = Mocap(MOCAP_CONF)
+    mocap.importData()
+    openpose = Openpose3d(OPENPOSE_CONF)
+
+    ## joint trajectories in the axes of the viewers (z is vertical); undetected openpose joints are NaN
+    mc_points = mocap.data[:, MOCAP_CONF['JOINT_IDX']] * np.array([-1, -1, 1])
+    op_frames = np.arange(min(OPENPOSE_CONF['FRAME_NUM'], len(openpose.data)))
+    op_points = openpose.loadFrames(op_frames, isScale=False, isCenter=False)[:, OPENPOSE_CONF['JOINT_IDX']]
+    op_points[~np.any(openpose.data[op_frames, OPENPOSE_CONF['JOINT_IDX']] != 0, axis=1)] = np.nan
+
+    scale_min, scale_max, scale_step = args.scales
+    sync = estimateFrameSync(mc_points, op_points, np.arange(scale_min, scale_max + scale_step / 2, scale_step),
+                             kind=args.signal, min_overlap=args.min_overlap)
+    sync['signal'] = args.signal
+
+    print('mocap frame = fc * {:.4f} + {:.1f}'.format(sync['skip'], sync['start']), 'correlation:', sync['score'],
+          'time: {:.2f}s'.format(time.perf_counter() - t))
+    if not args.no_save:
+        saveFrameSync(sync)
+
+    ## both signals on the openpose time axis
+    mc_signal = getSignal(resample(mc_points, sync['skip']), args.signal)
+    shift = sync['start'] / sync['skip']
+    plt.plot(op_frames, getSignal(op_points, args.signal), label='MV-OpenPose')
+    plt.plot(np.arange(len(mc_signal)) - shift, mc_signal, label='Optical Motion Capture')
+    plt.xlim(op_frames[0], op_frames[-1])
+    plt.xlabel("Frame")
+    plt.ylabel(args.signal)
+    plt.legend()
+    plt.grid(True)
+    plt.show()
@@ -1,16 +1,84 @@
-import math
+import os
+import json
 import numpy as np
 
+from loadData import loadTrc, loadPose3d, listPose3d, getFingerprint, getDirFingerprint
+
 ## -----------------##
 ## tools
 ## -----------------##
 
-## get distance from two coordinates
-def getDist(p1, p2):
-    dx = (p2[0] - p1[0]) * (p2[0] - p1[0])
-    dy = (p2[1] - p1[1]) * (p2[1] - p1[1])
-    dz = (p2[2] - p1[2]) * (p2[2] - p1[2])
-    return math.sqrt(dx + dy + dz)
+## center and radius of a joint trajectory (frames, 3), computed for all frames at once.
+##   center, radius                 : mean center and mean distance from it (NaN frames are ignored)
+##   median_center, trimmed_radius  : robust variants; undetected frames (all zeros) are also ignored
+##                                    and the farthest `trim` fraction of distances is cut off.
+##                                    NaN if no frame is detected (valid_ratio 0, see selectScale).
+def getScaleStats(points, trim=0.1):
+    points = np.asarray(points, dtype=float)
+    finite = np.all(np.isfinite(points), axis=1)
+    detected = finite & np.any(points != 0, axis=1)
+
+    center = np.mean(points[finite], axis=0)
+    radius = np.mean(np.linalg.norm(points[finite] - center, axis=1))
+
+    median_center, trimmed_radius = np.full(3, np.nan), np.nan
+    if np.any(detected):
+        median_center = np.median(points[detected], axis=0)
+        dist = np.sort(np.linalg.norm(points[detected] - median_center, axis=1))
+        num_keep = max(1, int(np.ceil(len(dist) * (1.0 - trim))))
+        trimmed_radius = np.mean(dist[:num_keep])
+
+    return {
+        'center': center,
+        'radius': radius,
+        'median_center': median_center,
+        'trimmed_radius': trimmed_radius,
+        'valid_ratio': np.mean(detected),
+    }
+
+## select (radius, center) from the stats. set configs['SCALE_ROBUST'] = True to use the robust variants.
+def selectScale(stats, configs):
+    if configs.get('SCALE_ROBUST', False):
+        if stats['valid_ratio'] == 0:
+            raise ValueError('SCALE_ROBUST: the joint is not detected in any frame, the robust scale cannot be computed.')
+        return stats['trimmed_radius'], stats['median_center'].copy()
+    return stats['radius'], stats['center'].copy()
+
+
+## normalization parameters are cached per dataset (in memory and in a json file next to the data),
+## keyed by joint index, frame count and trim ratio, and invalidated by the fingerprint of the source files.
+_scale_memo = {}
+
+def loadScaleStats(cache_path, key, fingerprint, compute):
+    memo = _scale_memo.get((cache_path, key))
+    if memo is not None and memo['source'] == fingerprint:
+        return memo['stats']
+
+    entries = {}
+    try:
+        with open(cache_path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    entry = entries.get(key)
+    if entry is not None and entry['source'] == fingerprint:
+        stats = {k: np.array(v) if isinstance(v, list) else v for k, v in entry['stats'].items()}
+    else:
+        stats = compute()
+        entries[key] = {
+            'source': fingerprint,
+            'stats': {k: v.tolist() if isinstance(v, np.ndarray) else float(v) for k, v in stats.items()},
+        }
+        try:
+            with open(cache_path + '.tmp', mode='w') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError:
+            pass
+
+    _scale_memo[(cache_path, key)] = {'source': fingerprint, 'stats': stats}
+    return stats
 
 
 ##-------------------##
@@ -22,59 +90,20 @@ def GetScale_MoCap(configs):
     DATASET_FILE = configs['DATASET_FILE']
     JOINT_IDX = configs['JOINT_IDX']
 
-    ## gloabl
-    data = []
-
-    ## load-mocap-file
-    def loadCsv(fpath):
-        with open(fpath) as f:
-            loaddata = [s.strip() for s in f.readlines()]
-            
-            ## delete header
-            for i in range(6):
-                loaddata.pop(0)
-        
-            return loaddata
-
-    ## load mocap-joint points
-    def loadPoints(fc):
-        points = data[fc].split()
-        numJoints = (len(points) - 2) // 3
-
-        X = np.zeros(numJoints, dtype=float)
-        Y = np.zeros(numJoints, dtype=float)
-        Z = np.zeros(numJoints, dtype=float)
-        idx = 0; ct = 2
-        while ct < len(points):
-            X[idx] = float(points[ct]); ct += 1
-            Y[idx] = float(points[ct]); ct += 1
-            Z[idx] = float(points[ct]); ct += 1
-            idx += 1
-
-        return X[JOINT_IDX], Y[JOINT_IDX], Z[JOINT_IDX]
-
-    ## load dataset file
-    path = DATASET_DIR_ROOT + '/' + DATASET_FILE
-    data = loadCsv(path)
-
-    numFrame = len(data)
-    x_array = np.zeros(numFrame, dtype=float)
-    y_array = np.zeros(numFrame, dtype=float)
-    z_array = np.zeros(numFrame, dtype=float)
-    dist_array = np.zeros(numFrame, dtype=float)
-
-    for i in range(numFrame):
-        x_array[i], y_array[i], z_array[i] = loadPoints(i)
+    TRIM = configs.get('SCALE_TRIM', 0.1)
 
-    center = np.array([np.mean(x_array), np.mean(y_array), np.mean(z_array)])
-
-    for i in range(numFrame):
-        point = np.array([x_array[i], y_array[i], z_array[i]])
-        dist_array[i] = getDist(center, point)
+    ## load dataset file, (frames, markers, 3)
+    path = DATASET_DIR_ROOT + '/' + DATASET_FILE
+    def compute():
+        data = loadTrc(path)
+        return getScaleStats(data[:, JOINT_IDX], trim=TRIM)
 
-    radius = np.mean(dist_array)
+    if not configs.get('SCALE_CACHE', True):
+        return selectScale(compute(), configs)
 
-    return radius, center
+    key = 'joint{}_frames-all_trim{}'.format(JOINT_IDX, TRIM)
+    stats = loadScaleStats(path + '.scale.json', key, getFingerprint(path), compute)
+    return selectScale(stats, configs)
 
 
 ##-------------------##
@@ -86,30 +115,24 @@ def GetScale_OpenPose(configs):
     JOINT_IDX = configs['JOINT_IDX']
     FRAME_NUM = configs['FRAME_NUM']
 
-    def loadPoints(idx):
-        isY_reverse = -1   # 1 is not reverse.
-        path = '{}/pose{:04d}.txt'.format(DATASET_DIR_ROOT, idx)
-        point_array = np.loadtxt(path)
-        return point_array[JOINT_IDX, 0], isY_reverse*point_array[JOINT_IDX, 2], point_array[JOINT_IDX, 1]
-
-
-    numFrame = FRAME_NUM
-    x_array = np.zeros(numFrame, dtype=float)
-    y_array = np.zeros(numFrame, dtype=float)
-    z_array = np.zeros(numFrame, dtype=float)
-    dist_array = np.zeros(numFrame, dtype=float)
+    TRIM = configs.get('SCALE_TRIM', 0.1)
 
-    for i in range(numFrame):
-        x_array[i], y_array[i], z_array[i] = loadPoints(i)
+    def compute():
+        isY_reverse = -1   # 1 is not reverse.
+        ## (frames, 25, 3)
+        data = loadPose3d(DATASET_DIR_ROOT)
 
-    center = np.array([np.mean(x_array), np.mean(y_array), np.mean(z_array)])
+        joint = data[:FRAME_NUM, JOINT_IDX].astype(float)
+        points = np.stack([joint[:, 0], isY_reverse*joint[:, 2], joint[:, 1]], axis=1)
+        return getScaleStats(points, trim=TRIM)
 
-    for i in range(numFrame):
-        point = np.array([x_array[i], y_array[i], z_array[i]])
-        dist_array[i] = getDist(center, point)
+    if not configs.get('SCALE_CACHE', True):
+        return selectScale(compute(), configs)
 
-    radius = np.mean(dist_array)
-    return radius, center
+    key = 'joint{}_frames{}_trim{}'.format(JOINT_IDX, FRAME_NUM, TRIM)
+    fingerprint = getDirFingerprint(listPose3d(DATASET_DIR_ROOT))
+    stats = loadScaleStats(DATASET_DIR_ROOT + '/scale.json', key, fingerprint, compute)
+    return selectScale(stats, configs)
 
 ##-------------------##
 ## Debugging
@@ -1,103 +1,35 @@
-from scipy.spatial import KDTree
 import numpy as np
 
-from drow import setLines_at_openpose, setLines_at_optmocap
-
-def calcRigidTranformation(MatA, MatB):
-    A, B = np.copy(MatA).astype('float64'), np.copy(MatB).astype('float64')
-
-    centroid_A = np.mean(A, axis=0)
-    centroid_B = np.mean(B, axis=0)
-
-    A -= centroid_A
-    B -= centroid_B
-
-    H = np.dot(A.T, B)
-    U, S, V = np.linalg.svd(H)
-    R = np.dot(V.T, U.T)
-    T = np.dot(-R, centroid_A) + centroid_B
-
-    return R, T
-
-def calcAffineTransformation(MatA, MatB):
-    A, B = np.copy(MatA).astype('float64').T, np.copy(MatB).astype('float64').T
-    TRS = np.matmul(B, np.linalg.pinv(A))
-    return TRS
-
-def get_transform(MatA, MatB):
-    return np.matmul(MatB, np.linalg.pinv(MatA))
-
-class ICP(object):
-    def __init__(self, pointsA, pointsB):
-        self.pointsA = pointsA
-        self.pointsB = pointsB
-        self.kdtree = KDTree(self.pointsA)
-
-    def calculate(self, iter): ## 剛体変換
-        old_points = np.copy(self.pointsB)
-        new_points = np.copy(self.pointsB)
-
-        for i in range(iter):
-            neighbor_idx = self.kdtree.query(old_points)[1]
-            targets = self.pointsA[neighbor_idx]
-            R, T = calcRigidTranformation(old_points, targets)
-            new_points = np.dot(R, old_points.T).T + T
-
-            if  np.sum(np.abs(old_points - new_points)) < 0.000000001:
-                break
-
-            old_points = np.copy(new_points)
-
-        return new_points
-
-    def calculate_s(self, iter): ## Affine変換
-        old_points = np.copy(self.pointsB)
-        new_points = np.copy(self.pointsB)
-
-        for i in range(iter):
-            # 3dim
-            neighbor_idx = self.kdtree.query(old_points)[1]
-            targets = self.pointsA[neighbor_idx]
-
-            # 4dim 
-            source = np.hstack((old_points, np.ones((old_points.shape[0], 1))))
-            targets = np.hstack((targets, np.ones((targets.shape[0], 1))))
-
-            TRS = calcAffineTransformation(source, targets)
-            new_points = np.dot(TRS, source.T).T
-            new_points = np.delete(new_points, -1, axis=1)
-
-            # 3dim
-            if  np.sum(np.abs(old_points - new_points)) < 0.000000001:
-                break
-
-            old_points = np.copy(new_points)
-        
-        return new_points
+from skeleton import BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, getSegments, getBoneColors, makeLineCollection
+from icp import ICP, loadJointMap, saveJointMap, estimateJointMap
+from plyFile import loadPlyPoints, readKeyframeBlocks
 
 # op = OpenPose, mc = MotionCapture
-def icp_run(ply_mc, ply_op, iter=100, scale_ignore=True, isSave=True):
-    def load_ply(f_name):
-        with open(f_name) as f:
-            points = [s.strip() for s in f.readlines()]; del points[:10]
-            output = np.zeros((len(points), 3))
-            for idx, point in enumerate(points):
-                output[idx] = np.array(list(map(float, point.split())))[:3]
-            return output
-
-    mc_points = load_ply(ply_mc)
-    op_points = load_ply(ply_op)
+## mode: 'rigid', 'similarity' (rotation + uniform scale + translation) or 'affine'.
+## joint_map: {openpose joint: [mocap marker, ...]}. if given, the keyframes are aligned in closed form
+## with these correspondences and refined by `refine` iterations of nearest-neighbour ICP.
+## stop: stopping rules of the ICP loop (see icp.DEFAULT_STOP).
+## robust: outlier handling of the correspondences (see icp.DEFAULT_ROBUST).
+def icp_run(ply_mc, ply_op, iter=100, mode='affine', isSave=True, joint_map=None, refine=0, stop=None, robust=None):
+    mc_points = loadPlyPoints(ply_mc)
+    op_points = loadPlyPoints(ply_op)
 
     ## run icp ICP(dst, src)
-    icp = ICP(mc_points, op_points)
-    if scale_ignore:
-        icp_points = icp.calculate(iter)
+    icp = ICP(mc_points, op_points, stop=stop, robust=robust)
+    ## keyframes recorded by make-keyframes-plysets.py (older sets: 25 joints per keyframe)
+    blocks = readKeyframeBlocks(ply_op)
+    num_frames = len(blocks) if blocks else len(op_points) // 25
+    if joint_map is not None:
+        icp.icp_correspond(joint_map, num_frames, mode=mode, refine=refine)
     else:
-        icp_points = icp.calculate_s(iter)
+        icp.run(iter, mode)
+    icp_points = icp.icp_points
+
+    if icp.report:
+        print('icp report:', ', '.join('{}: {}'.format(k, v) for k, v in icp.report.items()))
 
     from matplotlib import pyplot
     from mpl_toolkits.mplot3d import Axes3D
-    import mpl_toolkits.mplot3d.art3d as art3d
 
     fig = pyplot.figure()
     ax = Axes3D(fig)
@@ -109,28 +41,46 @@ def icp_run(ply_mc, ply_op, iter=100, scale_ignore=True, isSave=True):
     ax.plot(mc_points[:,0], mc_points[:,1], mc_points[:,2], "o", color="#ff0000", ms=4, mew=0.5)
     ax.plot(icp_points[:,0], icp_points[:,1], icp_points[:,2], "o", color="#000000", ms=4, mew=0.5)
 
-    X, Y, Z = setLines_at_openpose(op_points[:,0], op_points[:,1], op_points[:,2], 8)
-    for i, (x, y, z) in enumerate(zip(X, Y, Z)):
-        line = art3d.Line3D(x, y, z, color=pyplot.cm.jet(255//len(_BonesV2)*(i%24)))
-        ax.add_line(line)
+    segments = getSegments(op_points, BONES_OPENPOSE, NUM_JOINTS_OPENPOSE)
+    colors = getBoneColors(len(BONES_OPENPOSE), len(segments) // len(BONES_OPENPOSE))
+    ax.add_collection3d(makeLineCollection(segments, colors))
 
     pyplot.show()
 
-    final_result = calcAffineTransformation(op_points, icp_points)
+    ## 4x4 transformation of the selected mode (see icp.applyTransform)
+    final_result = icp.transform
 
     if not isSave:
         print('transform parameter:', final_result)
     else:
         np.save('results/transform', final_result)
+        ## nearest marker of each joint after alignment, usable as joint_map of later runs.
+        saveJointMap('results/joint_map.json', estimateJointMap(mc_points, icp_points, num_frames))
 
 ## main
 if __name__ == '__main__':
-    import sys
-    args = sys.argv
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', help='transformation fitted by icp', choices=['rigid', 'similarity', 'affine'], default='affine')
+    parser.add_argument('--scale_False', help='same as --mode rigid', action='store_true')
+    parser.add_argument('--joint_map', help='json file of openpose joint -> mocap marker(s), aligns in closed form')
+    parser.add_argument('--refine', help='nearest-neighbour icp iterations after the closed-form alignment', type=int, default=0)
+    parser.add_argument('--rel_cost', help='stop when the relative change of the icp cost is below this', type=float)
+    parser.add_argument('--transform_delta', help='stop when the transformation of one iteration is this close to identity', type=float)
+    parser.add_argument('--same_pairs', help='stop when the nearest-neighbour pairs do not change', action='store_true')
+    parser.add_argument('--robust', help='outlier handling of the icp correspondences', choices=['trim', 'threshold', 'huber'])
+    parser.add_argument('--robust_param', help='kept fraction (trim) or distance (threshold, huber)', type=float)
+    args = parser.parse_args()
+    if args.robust and args.robust_param is None:
+        parser.error('--robust {} needs --robust_param'.format(args.robust))
+
+    joint_map = loadJointMap(args.joint_map) if args.joint_map else None
+    mode = 'rigid' if args.scale_False else args.mode
+    stop = {'rel_cost': args.rel_cost, 'transform_delta': args.transform_delta, 'same_pairs': args.same_pairs}
+    robust = {'method': args.robust, 'param': args.robust_param} if args.robust else None
 
     ## icp_run(dst, src)
-    if len(args) == 2 and args[1] == '--scale_False':
-        icp_run('keyframes/opt-mocap.ply', 'keyframes/mv-openpose.ply', scale_ignore=True)
-    else:
-        icp_run('keyframes/opt-mocap.ply', 'keyframes/mv-openpose.ply')
+    icp_run('keyframes/opt-mocap.ply', 'keyframes/mv-openpose.ply', mode=mode,
+            joint_map=joint_map, refine=args.refine, stop=stop, robust=robust)
     
\ No newline at end of file
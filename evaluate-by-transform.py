@@ -0,0 +1,286 @@
+import sys
+import time
+import numpy as np
+
+from compScale import GetScale_OpenPose, GetScale_MoCap
+from getPoints import Mocap, Openpose3d
+from icp import ICP, loadJointMap, getCorrespondences, applyTransform
+from frameSync import loadFrameSync, toMocapFrame
+
+## mapping of the MV-OpenPose frame fc to the optical motion capture frame (fc*SKIP + START)
+SKIP_OPT_CAP_FRAME = 39
+SKIP_OPT_CAP_FRAME_START = 2650
+
+## results/framesync.json (check-framesync-by-xcorr.py) replaces the constants above, if it exists.
+FRAME_SYNC = loadFrameSync({'skip': SKIP_OPT_CAP_FRAME, 'start': SKIP_OPT_CAP_FRAME_START})
+
+MOCAP_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/opt-mocap',
+    'DATASET_FILE' : 'optmocap.trc',
+    'JOINT_IDX' : 29,
+}
+
+OPENPOSE_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/mv-openpose/3dpose',
+    'JOINT_IDX' : 8,
+    'FRAME_NUM' : 750,
+    'ADJ_SCALE' : 0.9,
+    'ADJ_CENTER_Z': 0.012,
+}
+
+EXPORT_CONF = {
+    'EXPORT_DIR' : 'results',
+}
+
+## --stream: frames per chunk and the histogram of the errors (values above HIST_MAX go to an overflow bin)
+STREAM_CONF = {
+    'CHUNK_FRAMES' : 256,
+    'HIST_BINS' : 200,
+    'HIST_MAX' : 2.0,
+}
+
+## openpose frames (all frames of the session) and the mocap frames paired with them.
+## frames whose mocap frame is out of range are dropped.
+def getFrameMapping(mocap, openpose, sync):
+    op_frames = np.arange(len(openpose.data))
+    mc_frames = toMocapFrame(op_frames, sync)
+    valid = (mc_frames >= 0) & (mc_frames < len(mocap.data))
+    return op_frames[valid], mc_frames[valid]
+
+## normalization parameters (scale, center) of both streams, as used by getPly.py for the keyframes.
+## the openpose frames are normalized twice there (Openpose3d.loadPoints and getPly), so results/transform.npy
+## fitted on the keyframes maps from that space; the evaluation normalizes the frames in the same way.
+def getNormalization():
+    mocap_scale, mocap_center = GetScale_MoCap(MOCAP_CONF)
+    openpose_scale, openpose_center = GetScale_OpenPose(OPENPOSE_CONF)
+    ## adjust
+    openpose_scale = openpose_scale * OPENPOSE_CONF['ADJ_SCALE']
+    openpose_center = np.array(openpose_center, dtype='float64')
+    openpose_center[2] += OPENPOSE_CONF['ADJ_CENTER_Z']
+
+    return {'mocap': (mocap_scale, mocap_center), 'openpose': (openpose_scale, openpose_center)}
+
+## normalized points of the paired frames (see getNormalization).
+##   returns mc_points (frames, 62, 3), op_points (frames, 25, 3), op_detected (frames, 25)
+def loadPairedFrames(mocap, openpose, op_frames, mc_frames, norm):
+    mocap_scale, mocap_center = norm['mocap']
+    openpose_scale, openpose_center = norm['openpose']
+    mc_points = (mocap.loadFrames(mc_frames) - mocap_center) / mocap_scale
+    op_points = (openpose.loadFrames(op_frames) - openpose_center) / openpose_scale
+    ## undetected joints are written as zeros
+    op_detected = np.any(openpose.data[op_frames] != 0, axis=2)
+
+    return mc_points, op_points, op_detected
+
+## normalized points of the whole session, all frames at once.
+##   returns mc_points, op_points, op_detected (see loadPairedFrames), op_frames, mc_frames
+def loadSession(mocap, openpose, sync):
+    op_frames, mc_frames = getFrameMapping(mocap, openpose, sync)
+    norm = getNormalization()
+
+    return loadPairedFrames(mocap, openpose, op_frames, mc_frames, norm) + (op_frames, mc_frames)
+
+## same as loadSession, but yields the session in chunks of frames. only the paired mocap rows of
+## one chunk are read from the memory-mapped data, so memory use does not grow with the session.
+def iterSession(mocap, openpose, sync, chunk_frames):
+    op_frames, mc_frames = getFrameMapping(mocap, openpose, sync)
+    norm = getNormalization()
+
+    for i in range(0, len(op_frames), chunk_frames):
+        op_chunk, mc_chunk = op_frames[i:i + chunk_frames], mc_frames[i:i + chunk_frames]
+        yield loadPairedFrames(mocap, openpose, op_chunk, mc_chunk, norm) + (op_chunk, mc_chunk)
+
+## fit the transformation again with ICP on every `step` frame of the session (frames with missing
+## markers or undetected joints are skipped).
+def fitTransform(mc_points, op_points, op_detected, mode, step, joint_map=None):
+    complete = np.all(np.isfinite(mc_points), axis=(1, 2)) & np.all(op_detected, axis=1)
+    frames = np.flatnonzero(complete)[::step]
+
+    ## icp = ICP(dst, src)
+    icp = ICP(mc_points[frames].reshape(-1, 3), op_points[frames].reshape(-1, 3))
+    if joint_map is not None:
+        return icp.icp_correspond(joint_map, len(frames), mode=mode)
+    return icp.run(100, mode)
+
+## per-joint error (frames, 25) of the aligned openpose joints.
+## without joint_map each joint is paired with the nearest marker of the same frame, otherwise with
+## the mean of its mapped markers (unmapped joints are NaN). undetected joints are NaN.
+def calcErrors(mc_points, icp_points, op_detected, joint_map=None):
+    num_frames, num_joints = icp_points.shape[:2]
+
+    if joint_map is None:
+        dist = np.linalg.norm(icp_points[:, :, None] - mc_points[:, None], axis=3)
+        dist[np.isnan(dist)] = np.inf
+        errors = np.min(dist, axis=2)
+        errors[np.isinf(errors)] = np.nan
+    else:
+        joints = sorted(joint_map)
+        targets, source = getCorrespondences(mc_points.reshape(-1, 3), icp_points.reshape(-1, 3), joint_map, num_frames)
+        errors = np.full((num_frames, num_joints), np.nan)
+        errors[:, joints] = np.linalg.norm(targets - source, axis=1).reshape(num_frames, len(joints))
+
+    errors[~op_detected] = np.nan
+    return errors
+
+## summary rows [mean (MPJPE), median, max, number of valid values] along the axis
+def summarize(errors, axis):
+    valid = np.isfinite(errors)
+    count = np.sum(valid, axis=axis)
+    with np.errstate(invalid='ignore'):
+        filled = np.where(valid, errors, 0)
+        mean = np.sum(filled, axis=axis) / count
+        peak = np.max(np.where(valid, errors, -np.inf), axis=axis)
+    peak[count == 0] = np.nan
+    median = np.full(count.shape, np.nan)
+    median[count > 0] = np.nanmedian(np.moveaxis(errors, axis, -1)[count > 0], axis=-1)
+    return np.stack([mean, median, peak, count], axis=1)
+
+## online statistics of the errors per joint: mean and variance (chunk moments merged with the
+## running ones), max and a histogram. memory use does not depend on the number of frames.
+class RunningStats(object):
+    def __init__(self, num_joints, bins, hist_max):
+        self.edges = np.append(np.linspace(0, hist_max, bins + 1), np.inf)
+        self.count = np.zeros(num_joints)
+        self.mean = np.zeros(num_joints)
+        self.m2 = np.zeros(num_joints)
+        self.max = np.full(num_joints, -np.inf)
+        self.hist = np.zeros((num_joints, bins + 1), dtype=np.int64)
+
+    ## errors (frames, joints), NaN is ignored
+    def update(self, errors):
+        valid = np.isfinite(errors)
+        count = np.sum(valid, axis=0)
+        filled = np.where(valid, errors, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.sum(filled, axis=0) / count, 0)
+        m2 = np.sum(np.where(valid, errors - mean, 0) ** 2, axis=0)
+
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0)
+        self.count = total
+        self.max = np.maximum(self.max, np.max(np.where(valid, errors, -np.inf), axis=0))
+
+        joints = np.broadcast_to(np.arange(errors.shape[1]), errors.shape)[valid]
+        bins = np.searchsorted(self.edges, errors[valid], side='right') - 1
+        np.add.at(self.hist, (joints, bins), 1)
+
+    ## approximate median of each joint from the histogram (linear in the bin), NaN in the overflow bin
+    def median(self):
+        cum = np.cumsum(self.hist, axis=1)
+        half = self.count / 2.0
+        idx = np.minimum(np.sum(cum < half[:, None], axis=1), self.hist.shape[1] - 1)
+        before = np.where(idx > 0, cum[np.arange(len(idx)), idx - 1], 0)
+        inbin = self.hist[np.arange(len(idx)), idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(inbin > 0, (half - before) / inbin, 0)
+        width = self.edges[1] - self.edges[0]
+        overflow = idx == self.hist.shape[1] - 1
+        return np.where((self.count > 0) & ~overflow, self.edges[idx] + frac * width, np.nan)
+
+    ## summary rows [mean (MPJPE), std, median (approximate), max, count] per joint
+    def table(self):
+        valid = self.count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / self.count)
+        mean = np.where(valid, self.mean, np.nan)
+        peak = np.where(valid, self.max, np.nan)
+        return np.stack([mean, np.where(valid, std, np.nan), self.median(), peak, self.count], axis=1)
+
+    ## mean and std over all joints
+    def total(self):
+        count = np.sum(self.count)
+        mean = np.sum(self.count * self.mean) / count
+        var = (np.sum(self.m2) + np.sum(self.count * (self.mean - mean) ** 2)) / count
+        return mean, np.sqrt(var)
+
+## evaluate the session chunk by chunk. the per-frame rows are appended to the table as they are
+## computed and the per-joint table and the histogram are written at the end.
+def evaluateStream(mocap, openpose, transform, sync, joint_map=None):
+    stats = None
+    with open('{}/eval_frames.csv'.format(EXPORT_CONF['EXPORT_DIR']), mode='w') as f:
+        f.write('frame,mocap_frame,mpjpe,median,max,valid_joints\n')
+        for mc_points, op_points, op_detected, op_frames, mc_frames in iterSession(mocap, openpose, sync, STREAM_CONF['CHUNK_FRAMES']):
+            errors = calcErrors(mc_points, applyTransform(transform, op_points), op_detected, joint_map)
+            np.savetxt(f, np.column_stack([op_frames, mc_frames, summarize(errors, axis=1)]), delimiter=',',
+                       fmt=['%d', '%d', '%.6f', '%.6f', '%.6f', '%d'])
+
+            if stats is None:
+                stats = RunningStats(errors.shape[1], STREAM_CONF['HIST_BINS'], STREAM_CONF['HIST_MAX'])
+            stats.update(errors)
+
+    if stats is None:
+        raise ValueError('no openpose frame is paired with a mocap frame in range')
+    joint_stats = stats.table()
+    np.savetxt('{}/eval_joints.csv'.format(EXPORT_CONF['EXPORT_DIR']),
+               np.column_stack([np.arange(len(joint_stats)), joint_stats]), delimiter=',',
+               fmt=['%d', '%.6f', '%.6f', '%.6f', '%.6f', '%d'],
+               header='joint,mpjpe,std,median,max,valid_frames', comments='')
+    np.savetxt('{}/eval_hist.csv'.format(EXPORT_CONF['EXPORT_DIR']),
+               np.column_stack([stats.edges[:-1], stats.edges[1:], np.sum(stats.hist, axis=0)]), delimiter=',',
+               fmt=['%.6f', '%.6f', '%d'], header='low,high,count', comments='')
+
+    return stats
+
+## main
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transform', help='saved transformation applied to the openpose joints', default='results/transform.npy')
+    parser.add_argument('--fit', help='fit the transformation again with icp over the session instead of loading it', choices=['rigid', 'similarity', 'affine'])
+    parser.add_argument('--fit_step', help='use every N-th complete frame for --fit', type=int, default=25)
+    parser.add_argument('--joint_map', help='json file of openpose joint -> mocap marker(s), pairs the joints with these markers')
+    parser.add_argument('--skip', help='mocap frames per openpose frame', type=float, default=FRAME_SYNC['skip'])
+    parser.add_argument('--start', help='mocap frame of the first openpose frame', type=float, default=FRAME_SYNC['start'])
+    parser.add_argument('--stream', help='evaluate chunk by chunk with online statistics (memory use independent of the session length)', action='store_true')
+    args = parser.parse_args()
+    if args.stream and args.fit:
+        parser.error('--fit needs the whole session, it cannot be used with --stream')
+
+    t = time.perf_counter()
+
+    mocap = Mocap(MOCAP_CONF)
+    mocap.importData()
+    openpose = Openpose3d(OPENPOSE_CONF)
+
+    joint_map = loadJointMap(args.joint_map) if args.joint_map else None
+    sync = {'skip': args.skip, 'start': args.start}
+    if len(getFrameMapping(mocap, openpose, sync)[0]) == 0:
+        sys.exit('no openpose frame is paired with a mocap frame in range (skip: {}, start: {}, mocap frames: {}), check --skip / --start.'
+                 .format(sync['skip'], sync['start'], len(mocap.data)))
+
+    if args.stream:
+        stats = evaluateStream(mocap, openpose, np.load(args.transform), sync, joint_map)
+        mean, std = stats.total()
+        print('frames:', len(getFrameMapping(mocap, openpose, sync)[0]), 'MPJPE:', mean, 'std:', std,
+              'time: {:.2f}s'.format(time.perf_counter() - t))
+        sys.exit()
+
+    mc_points, op_points, op_detected, op_frames, mc_frames = loadSession(mocap, openpose, sync)
+
+    if args.fit:
+        transform = fitTransform(mc_points, op_points, op_detected, args.fit, args.fit_step, joint_map)
+    else:
+        transform = np.load(args.transform)
+    icp_points = applyTransform(transform, op_points)
+
+    errors = calcErrors(mc_points, icp_points, op_detected, joint_map)
+    frame_stats = summarize(errors, axis=1)
+    joint_stats = summarize(errors, axis=0)
+
+    ## results table (errors are in the normalized space of the viewers)
+    np.savetxt('{}/eval_frames.csv'.format(EXPORT_CONF['EXPORT_DIR']),
+               np.column_stack([op_frames, mc_frames, frame_stats]), delimiter=',',
+               fmt=['%d', '%d', '%.6f', '%.6f', '%.6f', '%d'],
+               header='frame,mocap_frame,mpjpe,median,max,valid_joints', comments='')
+    np.savetxt('{}/eval_joints.csv'.format(EXPORT_CONF['EXPORT_DIR']),
+               np.column_stack([np.arange(len(joint_stats)), joint_stats]), delimiter=',',
+               fmt=['%d', '%.6f', '%.6f', '%.6f', '%d'],
+               header='joint,mpjpe,median,max,valid_frames', comments='')
+    np.save('{}/eval_errors'.format(EXPORT_CONF['EXPORT_DIR']), errors)
+
+    print('frames:', len(errors), 'MPJPE:', np.nanmean(errors), 'median:', np.nanmedian(errors),
+          'time: {:.2f}s'.format(time.perf_counter() - t))
@@ -0,0 +1,200 @@
+import os
+import time
+import shutil
+import datetime
+import tempfile
+import numpy as np
+
+## headless: render with the Agg canvas, no window is opened.
+import matplotlib
+matplotlib.use('Agg')
+
+from compScale import GetScale_OpenPose, GetScale_MoCap
+from getPoints import Mocap, Openpose3d
+from loadData import loadTrc, loadPose3d
+from skeleton import BONES_MOCAP, BONES_OPENPOSE, NUM_JOINTS_MOCAP, NUM_JOINTS_OPENPOSE, getBoneColors
+from poseAnimation import PoseAnimation, FrameBlocks, writeFrames
+from frameSync import loadFrameSync, toMocapFrame
+from icp import applyTransform
+
+MOCAP_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/opt-mocap',
+    'DATASET_FILE' : 'optmocap.trc',
+    'JOINT_IDX' : 29,
+    ## mocap frames per frame of the 'mocap' scene
+    'SKIP_FRAME' : 30,
+}
+
+OPENPOSE_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/mv-openpose/3dpose',
+    'JOINT_IDX' : 8,
+    'FRAME_NUM' : 750,
+    'ADJ_SCALE' : 0.9,
+    'ADJ_CENTER_Z': 0.012,
+}
+
+EXPORT_CONF = {
+    'EXPORT_DIR' : 'results',
+    'TRANSFORM' : 'results/transform.npy',
+}
+
+## scenes of the viewers, with the frame rate of the viewer and its default mapping of the MV-OpenPose
+## frame fc to the optical motion capture frame (fc*skip + start). results/framesync.json
+## (check-framesync-by-xcorr.py) replaces the default mapping, if it exists.
+##   openpose  : view-mvopenpose-3d.py
+##   mocap     : view-optmocap-3d.py
+##   overlay   : view-mvopenpose-and-optmocap-3d.py
+##   transform : view-mvopenpose-and-optmocap-3d-transform.py (openpose transformed by icp in red, mocap in blue)
+SCENE_CONF = {
+    'openpose' : {'FPS': 10, 'SYNC': None},
+    'mocap' : {'FPS': 30, 'SYNC': None},
+    'overlay' : {'FPS': 10, 'SYNC': {'skip': 39, 'start': 2700}},
+    'transform' : {'FPS': 10, 'SYNC': {'skip': 39, 'start': 2650}},
+}
+SCENES = list(SCENE_CONF)
+
+## -----------------##
+## scenes
+## -----------------##
+
+## number of frames of the scene
+def getNumFrames(scene):
+    if scene == 'mocap':
+        path = MOCAP_CONF['DATASET_DIR_ROOT'] + '/' + MOCAP_CONF['DATASET_FILE']
+        return len(loadTrc(path)) // MOCAP_CONF['SKIP_FRAME']
+    return OPENPOSE_CONF['FRAME_NUM']
+
+## PoseAnimation of the scene, with the same data, limits and styles as its viewer
+def makeScene(scene, sync, dpi):
+    import matplotlib.pyplot as plt
+    fig = plt.figure(dpi=dpi)
+    num_frames = getNumFrames(scene)
+
+    if scene == 'openpose':
+        data = loadPose3d(OPENPOSE_CONF['DATASET_DIR_ROOT'])
+        def loadFrames(fcs):
+            point_array = data[fcs]
+            return np.stack([point_array[..., 0], -point_array[..., 2], point_array[..., 1]], axis=-1)
+
+        anim = PoseAnimation(num_frames, limits=((-0.5, 0.5), (0, 2), (-0.2, 0.2)), fig=fig)
+        anim.addLayer(FrameBlocks(loadFrames, num_frames), BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, bone_colors=getBoneColors(len(BONES_OPENPOSE)))
+        return anim
+
+    if scene == 'mocap':
+        data = loadTrc(MOCAP_CONF['DATASET_DIR_ROOT'] + '/' + MOCAP_CONF['DATASET_FILE'])
+        anim = PoseAnimation(num_frames, limits=((-2000, 2000), (-2500, 2500), (0, 2000)), fig=fig)
+        anim.addLayer(FrameBlocks(lambda fcs: data[fcs * MOCAP_CONF['SKIP_FRAME']], num_frames))
+        return anim
+
+    ## set scale.
+    openpose_scale, openpose_center = GetScale_OpenPose(OPENPOSE_CONF)
+    mocap_scale, mocap_center = GetScale_MoCap(MOCAP_CONF)
+    ## adjust
+    openpose_scale *= OPENPOSE_CONF['ADJ_SCALE']
+    openpose_center[2] += OPENPOSE_CONF['ADJ_CENTER_Z']
+
+    mocap = Mocap(MOCAP_CONF)
+    mocap.importData()
+    openpose = Openpose3d(OPENPOSE_CONF)
+    transform = np.load(EXPORT_CONF['TRANSFORM']) if scene == 'transform' else np.eye(4)
+
+    ## frames out of the mocap range are NaN (not drawn).
+    def loadMocapFrames(fcs):
+        mc_frames = toMocapFrame(fcs, sync)
+        valid = (mc_frames >= 0) & (mc_frames < len(mocap.data))
+        points = np.full((len(fcs), NUM_JOINTS_MOCAP, 3), np.nan)
+        points[valid] = mocap.loadFrames(mc_frames[valid])
+        return (points - mocap_center) / mocap_scale
+
+    def loadOpenposeFrames(fcs):
+        points = (openpose.loadFrames(fcs) - openpose_center) / openpose_scale
+        return applyTransform(transform, points)
+
+    limits = ((-2, 2), (-2.5, 2.5), (-1, 1))
+    if scene == 'overlay':
+        anim = PoseAnimation(num_frames, limits=limits, fig=fig)
+        anim.addLayer(FrameBlocks(loadMocapFrames, num_frames))
+        anim.addLayer(FrameBlocks(loadOpenposeFrames, num_frames), BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, bone_colors=getBoneColors(len(BONES_OPENPOSE)))
+    else:
+        anim = PoseAnimation(num_frames, limits=limits, title="Frame: {}", fig=fig)
+        anim.addLayer(FrameBlocks(loadMocapFrames, num_frames), BONES_MOCAP, NUM_JOINTS_MOCAP, color='b', markersize=2, lw=1)
+        anim.addLayer(FrameBlocks(loadOpenposeFrames, num_frames), BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, color='r', markersize=3, lw=1)
+    return anim
+
+
+## -----------------##
+## workers
+## -----------------##
+
+## each worker builds the scene once, when it is started.
+def initWorker(scene, sync, dpi, tmp_dir):
+    global worker_anim, worker_dir
+    worker_anim = makeScene(scene, sync, dpi)
+    worker_dir = tmp_dir
+
+## render a chunk of frames to a raw rgb file (frames, height, width, 3), returns its path.
+def renderChunk(args):
+    index, fcs = args
+    path = os.path.join(worker_dir, 'chunk_{:05d}.npy'.format(index))
+    images = None
+    for i, image in enumerate(worker_anim.renderFrames(fcs)):
+        if images is None:
+            images = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(len(fcs),) + image.shape)
+        images[i] = image
+
+    images.flush()
+    return path
+
+## frames of the chunk files in order, each file is removed when it is consumed.
+def iterChunks(paths):
+    for path in paths:
+        images = np.load(path, mmap_mode='r')
+        for image in images:
+            yield np.asarray(image)
+        del images
+        os.remove(path)
+
+## render the frames fcs of the scene over the worker processes, chunk by chunk, and write them to path.
+## the chunks are written in order while the workers render the following ones.
+def export(path, scene, fcs, fps, workers, chunk, sync, dpi=100):
+    from multiprocessing import Pool
+
+    chunks = [fcs[i:i + chunk] for i in range(0, len(fcs), chunk)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if workers > 1:
+            with Pool(workers, initializer=initWorker, initargs=(scene, sync, dpi, tmp_dir)) as pool:
+                writeFrames(path, iterChunks(pool.imap(renderChunk, enumerate(chunks))), fps)
+        else:
+            initWorker(scene, sync, dpi, tmp_dir)
+            writeFrames(path, iterChunks(renderChunk(c) for c in enumerate(chunks)), fps)
+
+## main
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scene', help='scene of the viewer to export', choices=SCENES, default='transform')
+    parser.add_argument('--format', help='output format (mp4 needs ffmpeg)', choices=['gif', 'mp4'], default='gif')
+    parser.add_argument('-o', '--out', help='output path (default: results/movie_<scene>_<date>.<format>)')
+    parser.add_argument('--fps', help='frame rate of the output (default: that of the viewer)', type=float)
+    parser.add_argument('--start', help='first frame', type=int, default=0)
+    parser.add_argument('--end', help='last frame (exclusive, default: all frames)', type=int)
+    parser.add_argument('--step', help='export every N-th frame', type=int, default=1)
+    parser.add_argument('-w', '--workers', help='number of worker processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', help='frames rendered by a worker at once', type=int, default=64)
+    parser.add_argument('--dpi', help='resolution of the frames', type=int, default=100)
+    args = parser.parse_args()
+    if args.format != 'gif' and shutil.which('ffmpeg') is None:
+        parser.error('ffmpeg is not found, {} cannot be written (use --format gif)'.format(args.format))
+
+    path = args.out or '{}/movie_{}_{}.{}'.format(EXPORT_CONF['EXPORT_DIR'], args.scene, datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S'), args.format)
+    end = getNumFrames(args.scene) if args.end is None else args.end
+    fcs = np.arange(args.start, end, args.step)
+
+    scene_conf = SCENE_CONF[args.scene]
+    fps = scene_conf['FPS'] if args.fps is None else args.fps
+    sync = None if scene_conf['SYNC'] is None else loadFrameSync(scene_conf['SYNC'])
+
+    t = time.perf_counter()
+    export(path, args.scene, fcs, fps, max(1, args.workers), args.chunk, sync, args.dpi)
+    print('export: {} ({} frames, {} workers) time: {:.1f}s'.format(path, len(fcs), args.workers, time.perf_counter() - t))
@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+
+## frame mapping of MV-OpenPose to optical motion capture: mocap frame = fc*skip + start.
+## estimated by check-framesync-by-xcorr.py and shared by all programs through this file.
+SYNC_FILE = 'results/framesync.json'
+
+## -----------------##
+## mapping
+## -----------------##
+
+## load the mapping {'skip': ..., 'start': ...}, or `default` if it has not been estimated yet.
+def loadFrameSync(default, path=SYNC_FILE):
+    if not os.path.exists(path):
+        return dict(default)
+
+    with open(path) as f:
+        sync = json.load(f)
+    return {'skip': sync['skip'], 'start': sync['start']}
+
+def saveFrameSync(sync, path=SYNC_FILE):
+    with open(path, mode='w') as f:
+        json.dump({k: float(v) if isinstance(v, (float, np.floating)) else v for k, v in sync.items()}, f, indent=1)
+
+## mocap frame(s) of the MV-OpenPose frame(s) fc
+def toMocapFrame(fc, sync):
+    return np.rint(np.asarray(fc) * sync['skip'] + sync['start']).astype(int)
+
+
+## -----------------##
+## estimation
+## -----------------##
+
+## 1-D standardized signal of a joint trajectory (frames, 3), missing frames (NaN) are interpolated.
+##   'height' : vertical position (z)
+##   'speed'  : distance moved per frame
+def getSignal(points, kind='speed'):
+    valid = np.all(np.isfinite(points), axis=1)
+    idx = np.arange(len(points))
+    filled = np.stack([np.interp(idx, idx[valid], points[valid, k]) for k in range(3)], axis=1)
+
+    if kind == 'height':
+        signal = filled[:, 2]
+    elif kind == 'speed':
+        signal = np.linalg.norm(np.diff(filled, axis=0, prepend=filled[:1]), axis=1)
+    else:
+        raise ValueError('unknown signal: {}'.format(kind))
+
+    return (signal - np.mean(signal)) / max(np.std(signal), 1e-12)
+
+## trajectory (frames, 3) resampled every `scale` frames (linear interpolation)
+def resample(points, scale):
+    t = np.arange(0, len(points) - 1, scale)
+    idx = np.arange(len(points))
+    return np.stack([np.interp(t, idx, points[:, k]) for k in range(3)], axis=1)
+
+## sum over i of a[i+lag]*b[i] for all lags (-(len(b)-1) .. len(a)-1) by FFT
+def crossCorrelate(a, b):
+    nfft = 1 << int(np.ceil(np.log2(len(a) + len(b) - 1)))
+    corr = np.fft.irfft(np.fft.rfft(a, nfft) * np.conj(np.fft.rfft(b, nfft)), nfft)
+    return np.concatenate([corr[nfft - (len(b) - 1):], corr[:len(a)]])
+
+## Pearson correlation of a and b over their overlap at each lag, computed with six FFT correlations.
+## lags overlapping less than min_overlap samples are -inf.
+def normCrossCorrelate(a, b, min_overlap):
+    ones_a, ones_b = np.ones(len(a)), np.ones(len(b))
+    n = np.rint(crossCorrelate(ones_a, ones_b))
+    sum_a, sum_b = crossCorrelate(a, ones_b), crossCorrelate(ones_a, b)
+    sum_aa, sum_bb = crossCorrelate(a * a, ones_b), crossCorrelate(ones_a, b * b)
+    sum_ab = crossCorrelate(a, b)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = (n * sum_ab - sum_a * sum_b) / np.sqrt((n * sum_aa - sum_a ** 2) * (n * sum_bb - sum_b ** 2))
+    corr[(n < min_overlap) | ~np.isfinite(corr)] = -np.inf
+
+    return corr, np.arange(-(len(b) - 1), len(a))
+
+## best lag and its correlation for one scale, refined to sub-frame by a parabola through the peak.
+def matchScale(mc_points, op_signal, scale, kind, min_overlap):
+    mc_signal = getSignal(resample(mc_points, scale), kind)
+    corr, lags = normCrossCorrelate(mc_signal, op_signal, min_overlap)
+    i = int(np.argmax(corr))
+
+    lag = float(lags[i])
+    if 0 < i < len(corr) - 1 and np.all(np.isfinite(corr[i - 1:i + 2])):
+        denom = corr[i - 1] - 2 * corr[i] + corr[i + 1]
+        if denom < 0:
+            lag += 0.5 * (corr[i - 1] - corr[i + 1]) / denom
+
+    return corr[i], lag
+
+## estimate the mapping (mocap frame = fc*skip + start) from the joint trajectories of both streams,
+## mc_points (mocap frames, 3) and op_points (openpose frames, 3), by normalized cross-correlation
+## of their signals over the grid of scales. the best scale is refined `refine` times on a 10x finer grid.
+def estimateFrameSync(mc_points, op_points, scales, kind='speed', min_overlap=0.5, refine=2):
+    op_signal = getSignal(op_points, kind)
+    min_overlap = int(min_overlap * len(op_signal))
+
+    scales = np.asarray(scales, dtype=float)
+    step = scales[1] - scales[0] if len(scales) > 1 else 1.0
+    best = None
+    for level in range(refine + 1):
+        for scale in scales:
+            score, lag = matchScale(mc_points, op_signal, scale, kind, min_overlap)
+            if best is None or score > best['score']:
+                best = {'skip': float(scale), 'start': float(lag * scale), 'score': float(score)}
+
+        scales = best['skip'] + np.linspace(-step, step, 21)
+        scales = scales[scales > 0]
+        step /= 10
+
+    return best
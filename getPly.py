@@ -3,6 +3,7 @@ import datetime
 
 from compScale import GetScale_OpenPose, GetScale_MoCap
 from getPoints import Mocap, Openpose3d
+from plyFile import makeVertices, writePly
 
 ## generally, optical motion capture samples data very frequently
 ## adjust the parameter and fit to sampleing rate of MV-OpenPose 
@@ -28,15 +29,17 @@ class GetPly():
         self.openpose = Openpose3d(self.openpose_conf)
         
 
-        for i, f_num in enumerate(self.export_conf['FRAME_NUM']):
-            a, b = self.get_ply(f_num[0], f_num[1])
+        ## export_conf['MOCAP_FRAME'] (optional): exact mocap frame of each pair, instead of m_fc*SKIP_OPT_CAP_FRAME
+        mocap_frames = self.export_conf.get('MOCAP_FRAME') or [None] * len(self.export_conf['FRAME_NUM'])
+        for i, (f_num, mc_frame) in enumerate(zip(self.export_conf['FRAME_NUM'], mocap_frames)):
+            a, b = self.get_ply(f_num[0], f_num[1], mc_frame)
 
             if batch:
-                self.export_txt("{}/opt-mocap/m_{:2d}.ply".format(self.export_conf['EXPORT_DIR'], i), a)
-                self.export_txt("{}/mv-openpose/o_{:2d}.ply".format(self.export_conf['EXPORT_DIR'], i), b)
+                self.export_ply("{}/opt-mocap/m_{:2d}.ply".format(self.export_conf['EXPORT_DIR'], i), a, f_num)
+                self.export_ply("{}/mv-openpose/o_{:2d}.ply".format(self.export_conf['EXPORT_DIR'], i), b, f_num)
             else:
-                self.export_txt("{}/opt-mocap/m_{}.ply".format(self.export_conf['EXPORT_DIR'], datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')), a)
-                self.export_txt("{}/mv-openpose/o_{}.ply".format(self.export_conf['EXPORT_DIR'], datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')), b)    
+                self.export_ply("{}/opt-mocap/m_{}.ply".format(self.export_conf['EXPORT_DIR'], datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')), a, f_num)
+                self.export_ply("{}/mv-openpose/o_{}.ply".format(self.export_conf['EXPORT_DIR'], datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')), b, f_num)
 
     def scalize(self, scale, x, y, z):
         return x / scale, y / scale, z / scale
@@ -46,27 +49,13 @@ class GetPly():
         return x - c_x, y - c_y, z - c_z
 
 
+    ## vertices (xyz + rgb) of the point cloud
     def mk_ply(self, X, Y, Z, vertex_num, col):
-        ply = []
-        ply.append("ply\n")
-        ply.append("format ascii 1.0\n")
-        ply.append("element vertex {:d}\n".format(vertex_num))
-        ply.append("property float x\n")
-        ply.append("property float y\n")
-        ply.append("property float z\n")
-        ply.append("property uchar red\n")
-        ply.append("property uchar green\n")
-        ply.append("property uchar blue\n")
-        ply.append("end_header\n")
-
-        for x, y, z in zip(X, Y, Z):
-            ply.append("{} {} {} {} {} {}\n".format(x, y, z, col[0], col[1], col[2]))
-
-        return ply
-
-    def get_ply(self, m_fc, o_fc):
+        return makeVertices(np.stack([X, Y, Z], axis=1)[:vertex_num], col)
+
+    def get_ply(self, m_fc, o_fc, mc_frame=None):
         ## visualize mocap points
-        X, Y, Z = self.mocap.loadPoints(int(m_fc*SKIP_OPT_CAP_FRAME))
+        X, Y, Z = self.mocap.loadPoints(int(m_fc*SKIP_OPT_CAP_FRAME) if mc_frame is None else int(mc_frame))
         X, Y, Z = self.scalize(self.mocap_scale, X, Y, Z)
         X, Y, Z = self.centerlize(self.mocap_scale, self.mocap_center, X, Y, Z)
         ply_mocap = self.mk_ply(X, Y, Z, 62, (255,0,0))
@@ -79,9 +68,11 @@ class GetPly():
 
         return ply_mocap, ply_openpose
 
-    def export_txt(self, filename, txt_arr):
-        with open(filename, mode='w') as f:
-            f.writelines(txt_arr)
+    ## binary_little_endian by default, set export_conf['PLY_FORMAT'] = 'ascii' for text files.
+    ## the frame pair [m_fc, o_fc] is recorded in the header for make-keyframes-plysets.py.
+    def export_ply(self, filename, vertices, f_num):
+        writePly(filename, vertices, binary=self.export_conf.get('PLY_FORMAT', 'binary') != 'ascii',
+                 comments=['frame_pair {:d} {:d}'.format(int(f_num[0]), int(f_num[1]))])
 
 
 ## ------------ ##
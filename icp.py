@@ -2,88 +2,342 @@ from scipy.spatial import KDTree
 from matplotlib import pyplot
 from matplotlib import animation
 from mpl_toolkits.mplot3d import Axes3D
-import mpl_toolkits.mplot3d.art3d as art3d
 from math import sin, cos
+import hashlib
+import json
+import time
 
 import numpy as np
-from draw import setLines_at_openpose, setLines_at_optmocap
+from skeleton import BONES_OPENPOSE, BONES_MOCAP, NUM_JOINTS_OPENPOSE, NUM_JOINTS_MOCAP, getSegments, makeLineCollection
 
+## KD-trees are cached by the content of the points, so a cloud used again (e.g. the constant side
+## of the frame-sync search) is indexed only once.
+KDTREE_CACHE_SIZE = 256
+_kdtree_cache = {}
+
+def getKDTree(points):
+    points = np.ascontiguousarray(points, dtype='float64')
+    key = (points.shape, hashlib.sha1(points.tobytes()).hexdigest())
+
+    kdtree = _kdtree_cache.get(key)
+    if kdtree is None:
+        if len(_kdtree_cache) >= KDTREE_CACHE_SIZE:
+            del _kdtree_cache[next(iter(_kdtree_cache))]
+        kdtree = KDTree(points)
+        _kdtree_cache[key] = kdtree
+
+    return kdtree
+
+## joint_map: {src_joint: [dst_marker, ...]} within one frame, e.g. BODY_25 joint -> mocap marker(s).
+## a joint mapped to several markers is paired with the mean of them.
+def loadJointMap(path):
+    with open(path) as f:
+        return {int(k): [int(x) for x in v] for k, v in json.load(f).items()}
+
+def saveJointMap(path, joint_map):
+    with open(path, mode='w') as f:
+        json.dump({str(k): [int(x) for x in v] for k, v in sorted(joint_map.items())}, f, indent=1)
+
+## paired points of joint_map in each frame of the concatenated keyframe clouds.
+##   points_dst (..., num_frames*num_dst, 3), points_src (..., num_frames*num_src, 3)
+##   returns targets, source (..., num_frames*len(joint_map), 3)
+def getCorrespondences(points_dst, points_src, joint_map, num_frames):
+    joints = sorted(joint_map)
+    num_dst = points_dst.shape[-2] // num_frames
+    num_src = points_src.shape[-2] // num_frames
+
+    W = np.zeros((len(joints), num_dst))
+    for i, j in enumerate(joints):
+        W[i, joint_map[j]] = 1.0 / len(joint_map[j])
+
+    targets = np.matmul(W, points_dst.reshape(points_dst.shape[:-2] + (num_frames, num_dst, 3)))
+    source = points_src.reshape(points_src.shape[:-2] + (num_frames, num_src, 3))[..., joints, :]
+
+    shape = (num_frames * len(joints), 3)
+    return targets.reshape(targets.shape[:-3] + shape), source.reshape(source.shape[:-3] + shape)
+
+## joint_map from an aligned pair of keyframe clouds: each src joint is mapped to the dst marker
+## which is most frequently its nearest neighbour over the frames.
+def estimateJointMap(points_dst, icp_points, num_frames):
+    dst = points_dst.reshape(num_frames, -1, 3)
+    src = icp_points.reshape(num_frames, -1, 3)
+
+    dist = np.linalg.norm(src[:, :, None] - dst[:, None], axis=3)
+    dist[np.isnan(dist)] = np.inf
+    nearest = np.argmin(dist, axis=2)
+
+    return {j: [int(np.bincount(nearest[:, j], minlength=dst.shape[1]).argmax())] for j in range(src.shape[1])}
+
+## apply a saved transformation (results/transform.npy), 4x4 homogeneous or 3x3 (older files,
+## without translation), to points (..., 3)
+def applyTransform(transform, points):
+    transform = np.asarray(transform, dtype='float64')
+    points = np.matmul(points, transform[:3, :3].T)
+    if transform.shape == (4, 4):
+        points += transform[:3, 3]
+    return points
+
+## stopping rules of the ICP loop (a rule set to None is disabled).
+##   tol             : sum of absolute point displacement of one iteration
+##   rel_cost        : relative change of the cost (sum of squared distances) between iterations
+##   transform_delta : Frobenius norm of (transformation of one iteration - identity)
+##   same_pairs      : stop when the nearest-neighbour pairs are the same as in the previous iteration
+DEFAULT_STOP = {
+    'tol': 0.000000001,
+    'rel_cost': None,
+    'transform_delta': None,
+    'same_pairs': False,
+}
+
+## outlier handling of the correspondences (method None is plain least squares).
+##   'trim'      : keep the `param` fraction (e.g. 0.8) of pairs with the smallest distances
+##   'threshold' : keep the pairs closer than `param`
+##   'huber'     : Huber weights, 1 for distances up to `param` and param/distance above
+DEFAULT_ROBUST = {
+    'method': None,
+    'param': None,
+}
+
+## weights (..., N) of the correspondences from their distances (..., N); None without robust method.
+## pairs of a cloud (row) with too few inliers to solve the transformation fall back to weight 1.
+def calcWeights(dist, robust, min_inliers=4):
+    method, param = robust['method'], robust['param']
+    if method is None:
+        return None
+    if param is None:
+        raise ValueError('robust method {} needs a param (kept fraction or distance)'.format(method))
+
+    if method == 'trim':
+        cutoff = np.quantile(dist, param, axis=-1, keepdims=True)
+        weights = (dist <= cutoff).astype('float64')
+    elif method == 'threshold':
+        weights = (dist <= param).astype('float64')
+    elif method == 'huber':
+        weights = np.where(dist <= param, 1.0, param / np.maximum(dist, param))
+    else:
+        raise ValueError('unknown robust method: {}'.format(method))
+
+    few = np.sum(weights > 0, axis=-1, keepdims=True) < min_inliers
+    return np.where(few, 1.0, weights)
+
+## cost (...,) of the correspondences, comparable between clouds (e.g. frame offsets) with the robust method.
+## a rejected pair (weight 0) counts as a pair at the rejection distance (the threshold, or the trim cutoff),
+## so that rejecting more pairs of a badly aligned cloud never lowers its cost (truncated least squares).
+## weights: from calcWeights(dist, robust); plain sum of squared distances if None.
+def calcRobustCost(dist, weights, robust):
+    if weights is None:
+        return np.sum(np.square(dist), axis=-1)
+
+    if robust['method'] == 'trim':
+        cutoff = np.quantile(dist, robust['param'], axis=-1, keepdims=True)
+    else:
+        cutoff = robust['param']
+    return np.sum(np.where(weights > 0, weights * np.square(dist), np.square(cutoff)), axis=-1)
+
+## kdtree: prebuilt KDTree of points_dst (optional)
+## stop: stopping rules, overrides DEFAULT_STOP (optional)
+## robust: outlier handling, overrides DEFAULT_ROBUST (optional)
+## after each run, self.report holds the iterations, the time per phase (query / solve / apply),
+## the final RMS distance, the inlier ratio and the stopping rule that ended the loop.
 class ICP(object):
-    def __init__(self, points_dst, points_src, configs=None):
+    def __init__(self, points_dst, points_src, configs=None, kdtree=None, stop=None, robust=None):
         self.configs = configs
+        self.stop = dict(DEFAULT_STOP, **(stop or {}))
+        self.robust = dict(DEFAULT_ROBUST, **(robust or {}))
+        self.inlier_ratio = 1.0
+        self.report = {}
 
-        self.points_dst = points_dst
-        self.points_src = points_src
+        self.points_dst = np.asarray(points_dst, dtype='float64')
+        self.points_src = np.asarray(points_src, dtype='float64')
         self.icp_points = np.array([None])
-        self.kdtree = KDTree(self.points_dst)
+        self.transform = np.eye(4)
+        self.kdtree = kdtree if kdtree is not None else getKDTree(self.points_dst)
 
-    def calcRigidTranformation(self, MatA, MatB):
+    ## apply 4x4 homogeneous transformation to points (N, 3)
+    def applyTransformation(self, TRS, points):
+        return np.dot(TRS[:3, :3], points.T).T + TRS[:3, 3]
+
+    ## weights: (N,) weights of the pairs (optional)
+    def calcRigidTranformation(self, MatA, MatB, weights=None):
         A, B = np.copy(MatA).astype('float64'), np.copy(MatB).astype('float64')
 
-        centroid_A = np.mean(A, axis=0)
-        centroid_B = np.mean(B, axis=0)
+        if weights is None:
+            centroid_A = np.mean(A, axis=0)
+            centroid_B = np.mean(B, axis=0)
+        else:
+            weights = weights / np.sum(weights)
+            centroid_A = np.dot(weights, A)
+            centroid_B = np.dot(weights, B)
 
         A -= centroid_A
         B -= centroid_B
 
-        H = np.dot(A.T, B)
+        H = np.dot(A.T, B) if weights is None else np.dot(A.T * weights, B)
         U, S, V = np.linalg.svd(H)
         R = np.dot(V.T, U.T)
         T = np.dot(-R, centroid_A) + centroid_B
 
         return R, T
 
-    def calcAffineTransformation(self, MatA, MatB):
+    def calcAffineTransformation(self, MatA, MatB, weights=None):
         A, B = np.copy(MatA).astype('float64').T, np.copy(MatB).astype('float64').T
+        if weights is not None:
+            A *= np.sqrt(weights); B *= np.sqrt(weights)
         TRS = np.matmul(B, np.linalg.pinv(A))
         return TRS
 
-    def icp_calculate(self, iter):
-        old_points = np.copy(self.points_src)
-        new_points = np.copy(self.points_src)
+    ## rotation + uniform scale + translation (Umeyama), from the 3x3 cross-covariance.
+    def calcSimilarityTransformation(self, MatA, MatB, weights=None):
+        A, B = np.copy(MatA).astype('float64'), np.copy(MatB).astype('float64')
+        weights = np.ones(len(A)) / len(A) if weights is None else weights / np.sum(weights)
 
-        for i in range(iter):
-            dist, neighbor_idx = self.kdtree.query(old_points)
-            targets = self.points_dst[neighbor_idx]
-            R, T = self.calcRigidTranformation(old_points, targets)
-            new_points = np.dot(R, old_points.T).T + T
-            
-            if  np.sum(np.abs(old_points - new_points)) < 0.000000001:
-                break
+        centroid_A = np.dot(weights, A)
+        centroid_B = np.dot(weights, B)
+
+        A -= centroid_A
+        B -= centroid_B
+
+        H = np.dot(B.T * weights, A)
+        U, D, V = np.linalg.svd(H)
+        S = np.ones(3)
+        if np.linalg.det(U) * np.linalg.det(V) < 0:
+            S[2] = -1
+        R = np.dot(U * S, V)
+        c = np.sum(D * S) / np.dot(weights, np.sum(np.square(A), axis=1))
+        T = centroid_B - c * np.dot(R, centroid_A)
+
+        return c, R, T
+
+    ## 4x4 transformation of `mode` ('rigid', 'similarity' or 'affine') which maps source to targets (N, 3)
+    def calcTransformation(self, mode, source, targets, weights=None):
+        TRS = np.eye(4)
+        if mode == 'rigid':
+            R, T = self.calcRigidTranformation(source, targets, weights)
+            TRS[:3, :3] = R; TRS[:3, 3] = T
+        elif mode == 'similarity':
+            c, R, T = self.calcSimilarityTransformation(source, targets, weights)
+            TRS[:3, :3] = c * R; TRS[:3, 3] = T
+        elif mode == 'affine':
+            # 4dim
+            TRS = self.calcAffineTransformation(np.hstack((source, np.ones((source.shape[0], 1)))),
+                                                np.hstack((targets, np.ones((targets.shape[0], 1)))), weights)
+        else:
+            raise ValueError('unknown icp mode: {}'.format(mode))
+        return TRS
 
-            old_points = np.copy(new_points)
+    ## init: 4x4 initial transformation (warm start). returns the final 4x4 transformation.
+    def run(self, iter, mode, init=None):
+        stop = self.stop
+        transform = np.eye(4) if init is None else np.array(init, dtype='float64')
+        timer = {'query': 0.0, 'solve': 0.0, 'apply': 0.0}
 
-        self.icp_points = new_points
+        ## 4dim buffers (the last column stays 1), swapped every iteration instead of copied.
+        num_points = len(self.points_src)
+        old_points = np.ones((num_points, 4))
+        new_points = np.ones((num_points, 4))
+        targets = np.ones((num_points, 4))
+        old_points[:, :3] = self.points_src if init is None else self.applyTransformation(transform, self.points_src)
+        new_points[:, :3] = old_points[:, :3]
 
-    def icp_calculate_s(self, iter): ## Affine変換
-        old_points = np.copy(self.points_src)
-        new_points = np.copy(self.points_src)
+        cost = None
+        neighbor_idx = None
+        reason = 'iter'
+        iterations = 0
 
         for i in range(iter):
-            # 3dim
-            neighbor_idx = self.kdtree.query(old_points)[1]
-            targets = self.points_dst[neighbor_idx]
+            t = time.perf_counter()
+            dist, new_idx = self.kdtree.query(old_points[:, :3])
+            np.take(self.points_dst, new_idx, axis=0, out=targets[:, :3])
+            timer['query'] += time.perf_counter() - t
 
-            # 4dim 
-            source = np.hstack((old_points, np.ones((old_points.shape[0], 1))))
-            targets = np.hstack((targets, np.ones((targets.shape[0], 1))))
+            weights = calcWeights(dist, self.robust)
+            new_cost = np.dot(dist, dist) if weights is None else np.dot(weights, dist * dist)
+            if stop['rel_cost'] is not None and cost is not None and abs(cost - new_cost) <= stop['rel_cost'] * cost:
+                reason = 'rel_cost'; break
+            if stop['same_pairs'] and neighbor_idx is not None and np.array_equal(neighbor_idx, new_idx):
+                reason = 'same_pairs'; break
+            cost, neighbor_idx = new_cost, new_idx
 
-            TRS = self.calcAffineTransformation(source, targets)
-            new_points = np.dot(TRS, source.T).T
-            new_points = np.delete(new_points, -1, axis=1)
+            t = time.perf_counter()
+            if mode == 'affine':
+                TRS = self.calcAffineTransformation(old_points, targets, weights)
+            else:
+                TRS = self.calcTransformation(mode, old_points[:, :3], targets[:, :3], weights)
+            timer['solve'] += time.perf_counter() - t
 
-            # 3dim
-            if  np.sum(np.abs(old_points - new_points)) < 0.000000001:
-                break
+            t = time.perf_counter()
+            np.matmul(old_points[:, :3], TRS[:3, :3].T, out=new_points[:, :3])
+            new_points[:, :3] += TRS[:3, 3]
+            transform = np.dot(TRS, transform)
+            delta = np.sum(np.abs(old_points[:, :3] - new_points[:, :3]))
+            old_points, new_points = new_points, old_points
+            iterations += 1
+            timer['apply'] += time.perf_counter() - t
+
+            if stop['tol'] is not None and delta < stop['tol']:
+                reason = 'tol'; break
+            if stop['transform_delta'] is not None and np.linalg.norm(TRS - np.eye(4)) < stop['transform_delta']:
+                reason = 'transform_delta'; break
+
+        self.icp_points = old_points[:, :3].copy()
+        self.transform = transform
+
+        t = time.perf_counter()
+        dist, _ = self.kdtree.query(self.icp_points)
+        timer['query'] += time.perf_counter() - t
+        weights = calcWeights(dist, self.robust)
+        self.inlier_ratio = 1.0 if weights is None else np.mean(weights >= 1)
 
-            old_points = np.copy(new_points)
-        
-        self.icp_points = new_points
+        self.report = {
+            'mode': mode,
+            'iterations': iterations,
+            'stop': reason,
+            'time_query': timer['query'],
+            'time_solve': timer['solve'],
+            'time_apply': timer['apply'],
+            'rms': np.sqrt(np.mean(np.square(dist))),
+            'inlier_ratio': self.inlier_ratio,
+        }
+        return transform
 
+    def icp_calculate(self, iter, init=None): ## 剛体変換
+        return self.run(iter, 'rigid', init)
+
+    def icp_calculate_sim(self, iter, init=None): ## 相似変換
+        return self.run(iter, 'similarity', init)
+
+    def icp_calculate_s(self, iter, init=None): ## Affine変換
+        return self.run(iter, 'affine', init)
+
+    ## closed-form alignment with the known correspondences of joint_map (no KD-tree query),
+    ## optionally refined by `refine` iterations of nearest-neighbour ICP.
+    def icp_correspond(self, joint_map, num_frames, mode='affine', refine=0):
+        targets, source = getCorrespondences(self.points_dst, self.points_src, joint_map, num_frames)
+        TRS = self.calcTransformation(mode, source, targets)
+
+        ## robust: the pairs are weighted by their residuals of the first solve, and solved again
+        dist = np.linalg.norm(self.applyTransformation(TRS, source) - targets, axis=1)
+        weights = calcWeights(dist, self.robust)
+        if weights is not None:
+            TRS = self.calcTransformation(mode, source, targets, weights)
+            dist = np.linalg.norm(self.applyTransformation(TRS, source) - targets, axis=1)
+
+        self.correspond_cost = calcRobustCost(dist, weights, self.robust)
+        self.icp_points = self.applyTransformation(TRS, self.points_src)
+        self.transform = TRS
+
+        if refine > 0:
+            return self.run(refine, mode, init=TRS)
+
+        return TRS
+
+    ## sum of squared distances (robust cost if the robust method is set, see calcRobustCost and self.inlier_ratio)
     def calc_icpcost(self):
         if self.icp_points.all() != None:
             dist, neighbor_idx = self.kdtree.query(self.icp_points)
-            return np.sum(np.square(dist))
+            weights = calcWeights(dist, self.robust)
+            self.inlier_ratio = 1.0 if weights is None else np.mean(weights >= 1)
+            return calcRobustCost(dist, weights, self.robust)
         else:
             return -1  
 
@@ -103,15 +357,12 @@ class ICP(object):
             ax.plot(self.icp_points[:,0], self.icp_points[:,1], self.icp_points[:,2], "o", color="#000000", ms=1, mew=0.5)
 
             if self.configs:
-                X, Y, Z = setLines_at_openpose(self.icp_points[:,0], self.icp_points[:,1], self.icp_points[:,2], self.configs['FRAME_NUM'])
-                for i, (x, y, z) in enumerate(zip(X, Y, Z)):
-                    line = art3d.Line3D(x, y, z, color='red')
-                    ax.add_line(line)
-
-                X, Y, Z = setLines_at_optmocap(self.points_dst[:,0], self.points_dst[:,1], self.points_dst[:,2], self.configs['FRAME_NUM']):
-                for i, (x, y, z) in enumerate(zip(X, Y, Z)):
-                    line = art3d.Line3D(x, y, z, color='blue')
-                    ax.add_line(line)
+                ## bones of all keyframes, one artist per skeleton type
+                segments = getSegments(self.icp_points, BONES_OPENPOSE, NUM_JOINTS_OPENPOSE)
+                ax.add_collection3d(makeLineCollection(segments, 'red'))
+
+                segments = getSegments(self.points_dst, BONES_MOCAP, NUM_JOINTS_MOCAP)
+                ax.add_collection3d(makeLineCollection(segments, 'blue'))
             
             if not isSave: 
                 pyplot.show()
@@ -121,3 +372,258 @@ class ICP(object):
 
         else:
             print("Graph plot Error.")
+
+
+## ICP for a batch of candidates, e.g. all frame offsets of the frame-sync search.
+##   points_dst : (M, 3) shared destination or (B, M, 3) one destination per candidate
+##   points_src : (N, 3) shared source or (B, N, 3) one source per candidate
+## the transformations of all candidates are solved with stacked numpy operations.
+## kdtrees: prebuilt KDTree of the shared destination, or list of them (optional)
+## stop, robust, report: same as ICP (iterations, rms and inlier ratio are per candidate)
+class BatchICP(object):
+    def __init__(self, points_dst, points_src, configs=None, kdtrees=None, stop=None, robust=None):
+        self.configs = configs
+        self.stop = dict(DEFAULT_STOP, **(stop or {}))
+        self.robust = dict(DEFAULT_ROBUST, **(robust or {}))
+        self.report = {}
+
+        self.points_dst = np.asarray(points_dst, dtype='float64')
+        self.points_src = np.asarray(points_src, dtype='float64')
+
+        self.batch = max(len(x) if x.ndim == 3 else 1 for x in (self.points_dst, self.points_src))
+        if self.points_src.ndim == 2:
+            self.points_src = np.broadcast_to(self.points_src, (self.batch,) + self.points_src.shape)
+
+        ## KD-trees are built on the first query (the correspondence mode does not need them).
+        self.shared_dst = self.points_dst.ndim == 2
+        if self.shared_dst:
+            self.kdtrees = [kdtrees] * self.batch if kdtrees is not None else None
+            self.points_dst = np.broadcast_to(self.points_dst, (self.batch,) + self.points_dst.shape)
+        else:
+            self.kdtrees = kdtrees
+
+        self.icp_points = np.array([None])
+        self.transforms = np.tile(np.eye(4), (self.batch, 1, 1))
+
+    ## nearest neighbours of points (B, N, 3) in each destination.
+    ## out: (B, N, 3) buffer for the neighbours (optional)
+    def query(self, points, index=None, out=None):
+        if self.kdtrees is None:
+            if self.shared_dst:
+                self.kdtrees = [getKDTree(self.points_dst[0])] * self.batch
+            else:
+                self.kdtrees = [getKDTree(points) for points in self.points_dst]
+
+        if index is None:
+            index = range(self.batch)
+        dist = np.zeros(points.shape[:2])
+        neighbor_idx = np.zeros(points.shape[:2], dtype=int)
+        targets = np.zeros(points.shape) if out is None else out
+        for i, b in enumerate(index):
+            dist[i], neighbor_idx[i] = self.kdtrees[b].query(points[i])
+            np.take(self.points_dst[b], neighbor_idx[i], axis=0, out=targets[i])
+        return dist, targets, neighbor_idx
+
+    ## weights: (B, N) weights of the pairs (optional)
+    def calcRigidTranformation(self, MatA, MatB, weights=None):
+        MatA, MatB = MatA[:, :, :3], MatB[:, :, :3]
+        if weights is None:
+            centroid_A = np.mean(MatA, axis=1, keepdims=True)
+            centroid_B = np.mean(MatB, axis=1, keepdims=True)
+            H = np.matmul((MatA - centroid_A).transpose(0, 2, 1), MatB - centroid_B)
+        else:
+            weights = (weights / np.sum(weights, axis=1, keepdims=True))[:, :, None]
+            centroid_A = np.sum(weights * MatA, axis=1, keepdims=True)
+            centroid_B = np.sum(weights * MatB, axis=1, keepdims=True)
+            H = np.matmul((weights * (MatA - centroid_A)).transpose(0, 2, 1), MatB - centroid_B)
+
+        U, S, V = np.linalg.svd(H)
+        R = np.matmul(V.transpose(0, 2, 1), U.transpose(0, 2, 1))
+        T = centroid_B[:, 0] - np.einsum('bij,bj->bi', R, centroid_A[:, 0])
+
+        TRS = np.tile(np.eye(4), (len(R), 1, 1))
+        TRS[:, :3, :3] = R
+        TRS[:, :3, 3] = T
+        return TRS
+
+    def calcAffineTransformation(self, MatA, MatB, weights=None):
+        A, B = MatA.transpose(0, 2, 1), MatB.transpose(0, 2, 1)
+        if weights is not None:
+            A, B = A * np.sqrt(weights)[:, None, :], B * np.sqrt(weights)[:, None, :]
+        TRS = np.matmul(B, np.linalg.pinv(A))
+        return TRS
+
+    def calcSimilarityTransformation(self, MatA, MatB, weights=None):
+        MatA, MatB = MatA[:, :, :3], MatB[:, :, :3]
+        if weights is None:
+            weights = np.ones(MatA.shape[:2])
+        weights = (weights / np.sum(weights, axis=1, keepdims=True))[:, :, None]
+        centroid_A = np.sum(weights * MatA, axis=1, keepdims=True)
+        centroid_B = np.sum(weights * MatB, axis=1, keepdims=True)
+        A, B = MatA - centroid_A, MatB - centroid_B
+
+        H = np.matmul((weights * B).transpose(0, 2, 1), A)
+        U, D, V = np.linalg.svd(H)
+        S = np.ones(D.shape)
+        S[:, 2] = np.where(np.linalg.det(U) * np.linalg.det(V) < 0, -1, 1)
+        R = np.matmul(U * S[:, None, :], V)
+        c = np.sum(D * S, axis=1) / np.sum(weights * np.square(A), axis=(1, 2))
+        T = centroid_B[:, 0] - c[:, None] * np.einsum('bij,bj->bi', R, centroid_A[:, 0])
+
+        TRS = np.tile(np.eye(4), (len(R), 1, 1))
+        TRS[:, :3, :3] = c[:, None, None] * R
+        TRS[:, :3, 3] = T
+        return TRS
+
+    def getSolver(self, mode):
+        solvers = {
+            'rigid': self.calcRigidTranformation,
+            'similarity': self.calcSimilarityTransformation,
+            'affine': self.calcAffineTransformation,
+        }
+        if mode not in solvers:
+            raise ValueError('unknown icp mode: {}'.format(mode))
+        return solvers[mode]
+
+    ## init: (4, 4) or (B, 4, 4) initial transformations (warm start).
+    def run(self, iter, solver, init=None):
+        stop = self.stop
+        timer = {'query': 0.0, 'solve': 0.0, 'apply': 0.0}
+
+        ## 4dim points (the last column stays 1)
+        points = np.ones(self.points_src.shape[:2] + (4,))
+        points[:, :, :3] = self.points_src
+        if init is None:
+            self.transforms = np.tile(np.eye(4), (self.batch, 1, 1))
+        else:
+            self.transforms = np.array(np.broadcast_to(init, (self.batch, 4, 4)), dtype='float64')
+            points[:, :, :3] = np.matmul(points, self.transforms.transpose(0, 2, 1))[:, :, :3]
+
+        ## 4dim buffers of the active candidates (the last column stays 1), allocated once.
+        ## the first len(active) rows are used, and compacted when candidates stop.
+        source = np.ones(points.shape)
+        targets = np.ones(points.shape)
+        new_points = np.ones(points.shape)
+
+        active = np.arange(self.batch)
+        iterations = np.zeros(self.batch, dtype=int)
+        cost = np.full(self.batch, np.nan)
+        neighbor_idx = None
+
+        for i in range(iter):
+            n = len(active)
+            t = time.perf_counter()
+            np.take(points, active, axis=0, out=source[:n])
+            dist, _, new_idx = self.query(source[:n, :, :3], active, out=targets[:n, :, :3])
+            timer['query'] += time.perf_counter() - t
+
+            ## stopping rules checked before solving
+            weights = calcWeights(dist, self.robust)
+            new_cost = np.sum(np.square(dist) if weights is None else weights * np.square(dist), axis=1)
+            done = np.zeros(len(active), dtype=bool)
+            if stop['rel_cost'] is not None:
+                done |= np.abs(cost[active] - new_cost) <= stop['rel_cost'] * cost[active]
+            if stop['same_pairs'] and neighbor_idx is not None:
+                done |= np.all(neighbor_idx[active] == new_idx, axis=1)
+            if stop['same_pairs']:
+                if neighbor_idx is None:
+                    neighbor_idx = np.zeros((self.batch,) + new_idx.shape[1:], dtype=int)
+                neighbor_idx[active] = new_idx
+            cost[active] = new_cost
+
+            active = active[~done]
+            n = len(active)
+            if n == 0:
+                break
+            if done.any():
+                source[:n], targets[:n] = source[:len(done)][~done], targets[:len(done)][~done]
+                if weights is not None:
+                    weights = weights[~done]
+
+            t = time.perf_counter()
+            TRS = solver(source[:n], targets[:n], weights)
+            timer['solve'] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            np.matmul(source[:n], TRS.transpose(0, 2, 1), out=new_points[:n])
+            self.transforms[active] = np.matmul(TRS, self.transforms[active])
+            delta = np.sum(np.abs(source[:n, :, :3] - new_points[:n, :, :3]), axis=(1, 2))
+            points[active, :, :3] = new_points[:n, :, :3]
+            iterations[active] += 1
+            timer['apply'] += time.perf_counter() - t
+
+            # 3dim
+            done = np.zeros(len(active), dtype=bool)
+            if stop['tol'] is not None:
+                done |= delta < stop['tol']
+            if stop['transform_delta'] is not None:
+                done |= np.linalg.norm(TRS - np.eye(4), axis=(1, 2)) < stop['transform_delta']
+            active = active[~done]
+
+            if len(active) == 0:
+                break
+
+        self.icp_points = points[:, :, :3].copy()
+
+        t = time.perf_counter()
+        dist = self.query(self.icp_points)[0]
+        timer['query'] += time.perf_counter() - t
+        weights = calcWeights(dist, self.robust)
+        self.inlier_ratio = np.ones(self.batch) if weights is None else np.mean(weights >= 1, axis=1)
+
+        self.report = {
+            'iterations': iterations,
+            'time_query': timer['query'],
+            'time_solve': timer['solve'],
+            'time_apply': timer['apply'],
+            'rms': np.sqrt(np.mean(np.square(dist), axis=1)),
+            'inlier_ratio': self.inlier_ratio,
+        }
+        return self.transforms
+
+    def icp_calculate(self, iter, init=None): ## 剛体変換
+        return self.run(iter, self.calcRigidTranformation, init)
+
+    def icp_calculate_sim(self, iter, init=None): ## 相似変換
+        return self.run(iter, self.calcSimilarityTransformation, init)
+
+    def icp_calculate_s(self, iter, init=None): ## Affine変換
+        return self.run(iter, self.calcAffineTransformation, init)
+
+    ## closed-form alignment of every candidate with the known correspondences of joint_map,
+    ## optionally refined by `refine` iterations of nearest-neighbour ICP.
+    def icp_correspond(self, joint_map, num_frames, mode='affine', refine=0):
+        targets, source = getCorrespondences(self.points_dst, self.points_src, joint_map, num_frames)
+        ones = np.ones(source.shape[:2] + (1,))
+        source = np.concatenate([source, ones], axis=2)
+        targets = np.concatenate([targets, ones], axis=2)
+
+        solver = self.getSolver(mode)
+        TRS = solver(source, targets)
+
+        ## robust: the pairs are weighted by their residuals of the first solve, and solved again
+        dist = np.linalg.norm(np.matmul(source, TRS.transpose(0, 2, 1)) - targets, axis=2)
+        weights = calcWeights(dist, self.robust)
+        if weights is not None:
+            TRS = solver(source, targets, weights)
+            dist = np.linalg.norm(np.matmul(source, TRS.transpose(0, 2, 1)) - targets, axis=2)
+
+        self.correspond_cost = calcRobustCost(dist, weights, self.robust)
+        points = np.concatenate([self.points_src, np.ones(self.points_src.shape[:2] + (1,))], axis=2)
+        self.icp_points = np.matmul(points, TRS.transpose(0, 2, 1))[:, :, :3]
+        self.transforms = TRS
+
+        if refine > 0:
+            return self.run(refine, solver, init=TRS)
+
+        return TRS
+
+    ## (B,) sum of squared distances of each candidate (robust cost if the robust method is set, see calcRobustCost).
+    def calc_icpcost(self):
+        if self.icp_points.all() != None:
+            dist = self.query(self.icp_points)[0]
+            weights = calcWeights(dist, self.robust)
+            self.inlier_ratio = np.ones(self.batch) if weights is None else np.mean(weights >= 1, axis=1)
+            return calcRobustCost(dist, weights, self.robust)
+        else:
+            return -1 * np.ones(self.batch)
@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import numpy as np
+
+## number of header lines in the optical motion capture (.trc) file
+TRC_HEADER_LINES = 6
+
+## -----------------##
+## tools
+## -----------------##
+
+## size and modification time of the source file (used as cache key)
+def getFingerprint(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def isCacheValid(cache_path, meta_path, fingerprint):
+    if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+        return False
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return meta.get('source') == fingerprint
+
+## the array (shape) is written chunk by chunk from an iterator of (start, chunk), so that the whole
+## array never has to be in memory. write to a temporary file first, so that an interrupted run never
+## leaves a broken cache.
+def saveCacheChunks(cache_path, meta_path, shape, chunks, meta):
+    tmp_path = cache_path + '.tmp.npy'
+    array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+    for start, chunk in chunks:
+        array[start:start + len(chunk)] = chunk
+    array.flush()
+    del array
+    os.replace(tmp_path, cache_path)
+
+    with open(meta_path + '.tmp', mode='w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+##-------------------##
+## MoCap-Data (.trc)
+##-------------------##
+
+## number of columns of a row of the trc body
+def countTrcColumns(row):
+    if '\t' in row:
+        return len(row.split('\t'))
+    return len(row.split())
+
+## float32 values of the text separated by whitespace, None if a field is not a number
+def parseTrcValues(text):
+    try:
+        return np.fromstring(text, dtype=np.float32, sep=' ')
+    except ValueError:
+        return None
+
+## rows of the trc body padded with NaN to numColumns (markers missing at the end of a row).
+## a row with more columns, or with a field which is not a number, raises ValueError naming its frame.
+def padTrcRows(rows, numColumns, path, start):
+    padded = []
+    for i, row in enumerate(rows):
+        count = countTrcColumns(row)
+        if count > numColumns:
+            raise ValueError('{}: frame {} of the trc body has {} columns, expected {}.'.format(path, start + i, count, numColumns))
+        row = row + ' nan' * (numColumns - count)
+        values = parseTrcValues(row)
+        if values is None or values.size != numColumns:
+            raise ValueError('{}: frame {} of the trc body is not numeric.'.format(path, start + i))
+        padded.append(row)
+    return padded
+
+## parse rows of the trc body to (rows, markers, 3) float32 array.
+## all rows are converted in a single pass; the Frame# and Time columns are dropped.
+##   numColumns: columns of the body (default: those of the first row)
+##   start     : frame of the first row, to name a broken row in the error
+def parseTrcRows(rows, path, numColumns=None, start=0):
+    if numColumns is None:
+        numColumns = countTrcColumns(rows[0])
+    numJoints = (numColumns - 2) // 3
+
+    body = '\n'.join(rows)
+    ## missing markers are exported as empty fields between tabs.
+    if '\t\t' in body or '\t\n' in body or body.endswith('\t'):
+        body = re.sub(r'(?<=\t)(?=\t|\n|$)', 'nan', body)
+
+    values = parseTrcValues(body)
+    ## ragged rows (rare): pad them row by row, and parse again.
+    if values is None or values.size != len(rows) * numColumns:
+        body = '\n'.join(padTrcRows(body.split('\n'), numColumns, path, start))
+        values = parseTrcValues(body)
+
+    values = values.reshape(len(rows), numColumns)
+    points = values[:, 2:2 + numJoints * 3].reshape(len(rows), numJoints, 3)
+
+    return np.ascontiguousarray(points)
+
+## iterate over the trc body in chunks of rows, yielding (first frame, (rows, markers, 3) array).
+## only one chunk of text is held in memory at a time.
+def iterTrc(path, chunk_frames=4096):
+    with open(path) as f:
+        for i in range(TRC_HEADER_LINES):
+            f.readline()
+
+        ## all chunks take the number of columns from the first row of the body
+        start, rows, numColumns = 0, [], None
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                rows.append(line)
+                numColumns = numColumns or countTrcColumns(line)
+            if len(rows) == chunk_frames:
+                yield start, parseTrcRows(rows, path, numColumns, start)
+                start, rows = start + len(rows), []
+        if rows:
+            yield start, parseTrcRows(rows, path, numColumns, start)
+
+## (frames, markers) of the trc body, counted without parsing it.
+def getTrcShape(path):
+    with open(path) as f:
+        for i in range(TRC_HEADER_LINES):
+            f.readline()
+        first, frames = None, 0
+        for line in f:
+            if line.strip():
+                first = first or line.rstrip('\r\n')
+                frames += 1
+
+    return frames, parseTrcRows([first], path).shape[1]
+
+## parse the numeric body of the trc file to (frames, markers, 3) float32 array.
+def parseTrc(path):
+    return np.concatenate([points for start, points in iterTrc(path)])
+
+## load the trc file as (frames, markers, 3) float32 array.
+## the parsed array is saved next to the source file (*.trc.npy) and memory-mapped on later runs.
+## the cache is written chunk by chunk, so memory use does not grow with the length of the capture.
+def loadTrc(path, use_cache=True):
+    if not use_cache:
+        return parseTrc(path)
+
+    cache_path = path + '.npy'
+    meta_path = path + '.json'
+    fingerprint = getFingerprint(path)
+
+    if not isCacheValid(cache_path, meta_path, fingerprint):
+        frames, markers = getTrcShape(path)
+        shape = (frames, markers, 3)
+        saveCacheChunks(cache_path, meta_path, shape, iterTrc(path), {'source': fingerprint, 'shape': list(shape)})
+
+    return np.load(cache_path, mmap_mode='r')
+
+
+##-------------------##
+## OpenPose-Data (pose####.txt)
+##-------------------##
+
+POSE3D_FILE = re.compile(r'^pose(\d{4})\.txt$')
+
+## list pose####.txt files in the directory, sorted by frame number.
+def listPose3d(dir_root):
+    files = []
+    for entry in os.scandir(dir_root):
+        m = POSE3D_FILE.match(entry.name)
+        if m:
+            files.append((int(m.group(1)), entry))
+    files.sort(key=lambda x: x[0])
+
+    for i, (fc, entry) in enumerate(files):
+        if i != fc:
+            raise ValueError('{}: pose{:04d}.txt is missing.'.format(dir_root, i))
+
+    return [entry for fc, entry in files]
+
+def getDirFingerprint(entries):
+    stats = [entry.stat() for entry in entries]
+    return {
+        'frames': len(stats),
+        'size': sum(st.st_size for st in stats),
+        'mtime_ns': max((st.st_mtime_ns for st in stats), default=0),
+    }
+
+## iterate over the pose####.txt files in chunks of frames, yielding (first frame, (frames, joints, 3) array).
+## columns are kept as written.
+def iterPose3d(entries, chunk_frames=1024):
+    for start in range(0, len(entries), chunk_frames):
+        yield start, np.stack([np.loadtxt(entry.path, ndmin=2)[:, :3] for entry in entries[start:start + chunk_frames]]).astype(np.float32)
+
+## read all pose####.txt files to (frames, joints, 3) float32 array.
+def parsePose3d(entries):
+    return np.concatenate([points for start, points in iterPose3d(entries)])
+
+## load the whole 3dpose directory as (frames, joints, 3) float32 array.
+## the directory is read once, packed to pose3d.npy (and pose3d.json) and memory-mapped on later runs.
+def loadPose3d(dir_root, use_cache=True):
+    entries = listPose3d(dir_root)
+    if not use_cache:
+        return parsePose3d(entries)
+
+    cache_path = dir_root + '/pose3d.npy'
+    meta_path = dir_root + '/pose3d.json'
+    fingerprint = getDirFingerprint(entries)
+
+    if not isCacheValid(cache_path, meta_path, fingerprint):
+        shape = (len(entries), np.loadtxt(entries[0].path, ndmin=2).shape[0], 3)
+        saveCacheChunks(cache_path, meta_path, shape, iterPose3d(entries), {'source': fingerprint, 'shape': list(shape)})
+
+    return np.load(cache_path, mmap_mode='r')
+
+## iterate over the detection confidence (4th column) of the pose####.txt files in chunks of frames,
+## yielding (first frame, (frames, joints) array). files without the column are taken as confidence 1.
+def iterPose3dConfidence(entries, chunk_frames=1024):
+    for start in range(0, len(entries), chunk_frames):
+        rows = [np.loadtxt(entry.path, ndmin=2) for entry in entries[start:start + chunk_frames]]
+        yield start, np.stack([x[:, 3] if x.shape[1] > 3 else np.ones(len(x)) for x in rows]).astype(np.float32)
+
+## load the detection confidence of the whole 3dpose directory as (frames, joints) float32 array,
+## cached in pose3d_conf.npy (and pose3d_conf.json) in the same way as loadPose3d.
+def loadPose3dConfidence(dir_root, use_cache=True):
+    entries = listPose3d(dir_root)
+    if not use_cache:
+        return np.concatenate([conf for start, conf in iterPose3dConfidence(entries)])
+
+    cache_path = dir_root + '/pose3d_conf.npy'
+    meta_path = dir_root + '/pose3d_conf.json'
+    fingerprint = getDirFingerprint(entries)
+
+    if not isCacheValid(cache_path, meta_path, fingerprint):
+        shape = (len(entries), np.loadtxt(entries[0].path, ndmin=2).shape[0])
+        saveCacheChunks(cache_path, meta_path, shape, iterPose3dConfidence(entries), {'source': fingerprint, 'shape': list(shape)})
+
+    return np.load(cache_path, mmap_mode='r')
+
+
+##-------------------##
+## Debugging
+##-------------------##
+if __name__ == '__main__':
+    points = loadTrc('input_data/opt-mocap/optmocap.trc')
+    print(points.shape, points.dtype)
+
+    points = loadPose3d('input_data/mv-openpose/3dpose')
+    print(points.shape, points.dtype)
@@ -1,35 +1,85 @@
-import glob 
-
-def concatnate(dirname, num_joints):
-    plyfiles = glob.glob("{}/*.ply".format(dirname))
-
-    num_frames = len(plyfiles)
-    num_p = num_frames * num_joints
-
-    output = [
-        'ply',
-        'format ascii 1.0',
-        'element vertex {}'.format(num_p),
-        'property float x',
-        'property float y',
-        'property float z',
-        'property uchar red',
-        'property uchar green',
-        'property uchar blue',
-        'end_header'
-    ]
-
-    for ply in plyfiles:
-        with open(ply) as f:
-            points = [s.strip() for s in f.readlines()]
-            del points[:10]
-            output += points
-
-    with open('{}.ply'.format(dirname), mode='w') as f:
-        f.write('\n'.join(output))
+import os
+import glob
+import numpy as np
+
+from plyFile import PLY_DTYPE, readHeader, readPly, writePly, makeHeader, getFramePair, readKeyframeBlocks
+
+## headers of the keyframe files in the directory: [{'path', 'format', 'count', 'dtype', 'pair', 'data_offset'}, ...]
+## files with a recorded frame pair come first in the order of the pairs, the others follow by name.
+def readKeyframeHeaders(dirname):
+    keyframes = []
+    for path in glob.glob("{}/*.ply".format(dirname)):
+        with open(path, mode='rb') as f:
+            fmt, count, dtype, comments = readHeader(f)
+            keyframes.append({'path': path, 'format': fmt, 'count': count, 'dtype': dtype,
+                              'pair': getFramePair(comments), 'data_offset': f.tell()})
+
+    keyframes.sort(key=lambda k: (k['pair'] is None, k['pair'] or [], os.path.basename(k['path'])))
+    return keyframes
+
+## vertices of a keyframe file converted to PLY_DTYPE
+def loadVertices(keyframe):
+    vertices = readPly(keyframe['path'])
+    output = np.zeros(len(vertices), dtype=PLY_DTYPE)
+    for name in PLY_DTYPE.names:
+        if name in vertices.dtype.names:
+            output[name] = vertices[name]
+    return output
+
+## concatenate the keyframe files of the directory to <dirname>.ply.
+## the number of vertices is read from each header, and the binary vertex data of keyframes in
+## PLY_DTYPE is copied as it is (ascii keyframes are converted). the offset, size and frame pair of
+## each keyframe are recorded in the header (`comment keyframe offset count m_fc o_fc`).
+def concatnate(dirname, binary=True):
+    keyframes = readKeyframeHeaders(dirname)
+
+    comments, offset = [], 0
+    for keyframe in keyframes:
+        m_fc, o_fc = keyframe['pair'] or [-1, -1]
+        comments.append('keyframe {:d} {:d} {:d} {:d}'.format(offset, keyframe['count'], m_fc, o_fc))
+        offset += keyframe['count']
+
+    if not binary:
+        writePly('{}.ply'.format(dirname), np.concatenate([loadVertices(k) for k in keyframes]), binary=False, comments=comments)
+        return
+
+    with open('{}.ply'.format(dirname), mode='wb') as out:
+        out.write(makeHeader(PLY_DTYPE, offset, binary=True, comments=comments).encode('ascii'))
+        for keyframe in keyframes:
+            if keyframe['format'] == 'binary_little_endian' and keyframe['dtype'] == PLY_DTYPE:
+                with open(keyframe['path'], mode='rb') as f:
+                    f.seek(keyframe['data_offset'])
+                    out.write(f.read(keyframe['count'] * PLY_DTYPE.itemsize))
+            else:
+                out.write(loadVertices(keyframe).tobytes())
+
+## bundle the keyframe sets to a single npz file: xyz (N, 3) of each set, `<name>_offsets`
+## (keyframes+1) to slice the keyframes back out, and `frame_pairs` (keyframes, 2, -1 if not recorded).
+def makeBundle(path, plysets):
+    bundle = {}
+    for name, ply in plysets.items():
+        vertices = readPly(ply, mmap=True)
+        blocks = readKeyframeBlocks(ply)
+        bundle[name] = np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1)
+        bundle[name + '_offsets'] = np.array([b['offset'] for b in blocks] + [len(vertices)])
+        bundle['frame_pairs'] = np.array([b['pair'] or [-1, -1] for b in blocks]).reshape(-1, 2)
+
+    np.savez(path, **bundle)
 
 if __name__ == '__main__':
-    # concatnate (path/to/data-root-dir, num_of_joints)
-    concatnate('keyframes/opt-mocap', 62) 
-    concatnate('keyframes/mv-openpose', 25)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ascii', help='write the keyframe sets as ascii ply', action='store_true')
+    parser.add_argument('--npz', help='also bundle the keyframe sets to keyframes/keyframes.npz', action='store_true')
+    args = parser.parse_args()
+
+    # concatnate (path/to/data-root-dir)
+    concatnate('keyframes/opt-mocap', binary=not args.ascii)
+    concatnate('keyframes/mv-openpose', binary=not args.ascii)
 
+    if args.npz:
+        makeBundle('keyframes/keyframes.npz', {
+            'opt_mocap': 'keyframes/opt-mocap.ply',
+            'mv_openpose': 'keyframes/mv-openpose.ply',
+        })
@@ -0,0 +1,144 @@
+import io
+import numpy as np
+
+## vertex of the keyframe point clouds: xyz + rgb
+PLY_DTYPE = np.dtype([
+    ('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+    ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'),
+])
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+PLY_NAMES = {'i1': 'char', 'u1': 'uchar', 'i2': 'short', 'u2': 'ushort', 'i4': 'int', 'u4': 'uint', 'f4': 'float', 'f8': 'double'}
+
+PLY_FORMATS = {
+    'ascii': '=',
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+}
+
+## -----------------##
+## tools
+## -----------------##
+
+## vertices (N,) of PLY_DTYPE from points (N, 3) and one rgb color
+def makeVertices(points, color):
+    vertices = np.zeros(len(points), dtype=PLY_DTYPE)
+    vertices['x'], vertices['y'], vertices['z'] = points[:, 0], points[:, 1], points[:, 2]
+    vertices['red'], vertices['green'], vertices['blue'] = color
+    return vertices
+
+## comments: lines written as `comment ...` (e.g. the frame pair of a keyframe)
+def makeHeader(dtype, num_vertex, binary=True, comments=()):
+    header = [
+        'ply',
+        'format {} 1.0'.format('binary_little_endian' if binary else 'ascii'),
+    ]
+    header += ['comment {}'.format(comment) for comment in comments]
+    header.append('element vertex {:d}'.format(num_vertex))
+    for name in dtype.names:
+        header.append('property {} {}'.format(PLY_NAMES[dtype[name].str[1:]], name))
+    header.append('end_header')
+    return '\n'.join(header) + '\n'
+
+## header of an open ply file (binary mode). the file is left at the start of the vertex data.
+##   returns format, number of vertices, dtype of a vertex, comments
+def readHeader(f):
+    if f.readline().strip() != b'ply':
+        raise ValueError('{}: not a ply file.'.format(f.name))
+
+    fmt, num_vertex, fields, element, comments = None, 0, [], None, []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('{}: end_header is missing.'.format(f.name))
+        words = line.decode('ascii').split()
+        if not words:
+            continue
+        if words[0] == 'comment':
+            ## a bare `comment` line carries nothing
+            if len(words) > 1:
+                comments.append(line.decode('ascii').strip()[len('comment '):])
+            continue
+        if words[0] == 'end_header':
+            break
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            element = words[1]
+            if element == 'vertex':
+                num_vertex = int(words[2])
+        elif words[0] == 'property' and element == 'vertex':
+            fields.append((words[-1], PLY_TYPES[words[1]]))
+
+    if fmt is None:
+        raise ValueError('{}: format is missing.'.format(f.name))
+    if fmt not in PLY_FORMATS:
+        raise ValueError('{}: unknown format {}.'.format(f.name, fmt))
+    order = PLY_FORMATS[fmt]
+    return fmt, num_vertex, np.dtype([(name, order + kind) for name, kind in fields]), comments
+
+
+## -----------------##
+## read / write
+## -----------------##
+
+## write vertices (N,) of a structured dtype, the vertex data with a single tofile (binary) call.
+def writePly(path, vertices, binary=True, comments=()):
+    with open(path, mode='wb') as f:
+        f.write(makeHeader(vertices.dtype, len(vertices), binary, comments).encode('ascii'))
+        if binary:
+            vertices.astype(vertices.dtype.newbyteorder('<')).tofile(f)
+        else:
+            rows = io.StringIO()
+            fmt = ['%.9g' if vertices.dtype[name].kind == 'f' else '%d' for name in vertices.dtype.names]
+            np.savetxt(rows, vertices, fmt=fmt)
+            f.write(rows.getvalue().encode('ascii'))
+
+## read the vertices (N,) of a ply file (ascii or binary). binary vertex data is read with np.fromfile,
+## or memory-mapped with mmap=True.
+def readPly(path, mmap=False):
+    with open(path, mode='rb') as f:
+        fmt, num_vertex, dtype, comments = readHeader(f)
+        if fmt == 'ascii':
+            return np.loadtxt(io.TextIOWrapper(f, encoding='ascii'), dtype=dtype, max_rows=num_vertex, ndmin=1)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=(num_vertex,))
+        return np.fromfile(f, dtype=dtype, count=num_vertex)
+
+## xyz of the vertices as (N, 3) float64 array
+def loadPlyPoints(path):
+    vertices = readPly(path)
+    return np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1).astype('float64')
+
+
+## -----------------##
+## keyframe sets
+## -----------------##
+
+## frame pair [m_fc, o_fc] of a keyframe file (`comment frame_pair m_fc o_fc`), None if not recorded
+def getFramePair(comments):
+    for comment in comments:
+        words = comment.split()
+        if words and words[0] == 'frame_pair':
+            return [int(words[1]), int(words[2])]
+    return None
+
+## blocks of a keyframe set (`comment keyframe offset count m_fc o_fc`, see make-keyframes-plysets.py)
+## as [{'offset', 'count', 'pair'}, ...]. vertices[offset:offset+count] is one keyframe.
+def readKeyframeBlocks(path):
+    with open(path, mode='rb') as f:
+        comments = readHeader(f)[3]
+
+    blocks = []
+    for comment in comments:
+        words = comment.split()
+        if words and words[0] == 'keyframe':
+            offset, count, m_fc, o_fc = map(int, words[1:5])
+            blocks.append({'offset': offset, 'count': count, 'pair': None if m_fc < 0 else [m_fc, o_fc]})
+    return blocks
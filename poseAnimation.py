@@ -0,0 +1,279 @@
+import shutil
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from mpl_toolkits.mplot3d import Axes3D  ## registers the 3d projection
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from skeleton import getSegments
+
+## -----------------##
+## frames
+## -----------------##
+
+## frames of a stream loaded block by block, load(fcs) -> (len(fcs), joints, 3).
+## the blocks ahead of the cursor are loaded by a background thread while the current one is drawn,
+## so reading and normalizing the data does not hold up the playback. (a preloaded array works as well.)
+class FrameBlocks:
+    def __init__(self, load, num_frames, block=128, ahead=2):
+        self.load = load
+        self.num_frames = num_frames
+        self.block = block
+        self.ahead = ahead
+        self.num_blocks = -(-num_frames // block)
+        self.futures = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return self.num_frames
+
+    def loadBlock(self, b):
+        start = b * self.block
+        return self.load(np.arange(start, min(start + self.block, self.num_frames)))
+
+    ## points (joints, 3) of the frame fc
+    def __getitem__(self, fc):
+        b = fc // self.block
+        ## the animation loops, so the blocks after the last one are the first ones
+        keep = [(b + k) % self.num_blocks for k in range(self.ahead + 1)]
+        for k in keep:
+            if k not in self.futures:
+                self.futures[k] = self.executor.submit(self.loadBlock, k)
+        for k in list(self.futures):
+            if k not in keep:
+                self.futures.pop(k).cancel()
+
+        return self.futures[b].result()[fc - b * self.block]
+
+## frames of a stream in a bounded LRU cache, load(fcs) -> (len(fcs), joints, 3).
+## for random access (e.g. a slider): a background thread reads ahead the frames next to the last
+## requested one, in the direction the cursor moves, so that most requests are served from the cache.
+class FrameCache:
+    def __init__(self, load, num_frames, capacity=512, ahead=32):
+        self.load = load
+        self.num_frames = num_frames
+        self.capacity = capacity
+        self.ahead = ahead
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.cursor, self.direction = 0, 1
+        threading.Thread(target=self.readAhead, daemon=True).start()
+
+    def __len__(self):
+        return self.num_frames
+
+    def store(self, fcs, points):
+        with self.lock:
+            for fc, p in zip(fcs, points):
+                self.frames[fc] = p
+                self.frames.move_to_end(fc)
+            while len(self.frames) > self.capacity:
+                self.frames.popitem(last=False)
+
+    ## move the cursor to fc without loading it, the read-ahead follows the cursor
+    def prefetch(self, fc):
+        fc = int(fc)
+        if fc != self.cursor:
+            self.direction = 1 if fc > self.cursor else -1
+            self.cursor = fc
+        self.wakeup.set()
+
+    ## points (joints, 3) of the frame fc, loaded now if it is not cached yet
+    def __getitem__(self, fc):
+        fc = int(fc)
+        self.prefetch(fc)
+        with self.lock:
+            points = self.frames.get(fc)
+            if points is not None:
+                self.frames.move_to_end(fc)
+                return points
+
+        points = self.load(np.array([fc]))[0]
+        self.store([fc], [points])
+        return points
+
+    ## background thread: load the frames ahead of the cursor which are not cached, at once
+    def readAhead(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+
+            fcs = self.cursor + self.direction * np.arange(1, self.ahead + 1)
+            fcs = fcs[(fcs >= 0) & (fcs < self.num_frames)]
+            with self.lock:
+                fcs = [int(fc) for fc in fcs if int(fc) not in self.frames]
+            if fcs:
+                self.store(fcs, self.load(np.array(fcs)))
+
+
+## -----------------##
+## artists
+## -----------------##
+
+## Line3DCollection projects its segments only when the whole axes are drawn.
+## the blitted frames draw the artist alone, so it projects them itself.
+class BoneCollection(Line3DCollection):
+    def draw(self, renderer):
+        self.do_3d_projection()
+        super().draw(renderer)
+
+## joints (one Line3D) and bones (one Line3DCollection) of a stream, created once and updated per frame.
+##   frames: (frames, joints, 3) array or FrameBlocks
+##   bones : (bones, 2) joint indices, None to draw the joints only
+class PoseLayer:
+    def __init__(self, ax, frames, bones=None, num_joints=None, color='k', bone_colors=None, markersize=None, lw=None):
+        self.frames = frames
+        self.bones = bones
+        self.num_joints = num_joints
+
+        style = {} if markersize is None else {'markersize': markersize}
+        self.points, = ax.plot([], [], [], '.', color=color, **style)
+
+        self.lines = None
+        if bones is not None:
+            style = {} if lw is None else {'lw': lw}
+            colors = color if bone_colors is None else bone_colors
+            self.lines = BoneCollection(np.zeros((len(bones), 2, 3)), colors=colors, **style)
+            ax.add_collection3d(self.lines)
+
+    ## set the data of frame fc, returns the updated artists
+    def update(self, fc):
+        points = self.frames[fc]
+        self.points.set_data_3d(points[:, 0], points[:, 1], points[:, 2])
+        if self.lines is None:
+            return [self.points]
+
+        self.lines.set_segments(getSegments(points, self.bones, self.num_joints))
+        return [self.points, self.lines]
+
+
+## -----------------##
+## animation
+## -----------------##
+
+## 3d animation of pose layers. the axes (view, limits, labels) and the artists are set up once,
+## each frame only updates the data of the artists, and the playback is blitted.
+##   limits: (xlim, ylim, zlim)
+##   view  : (elev, azim), None to keep the default view
+##   title : format of the frame label (e.g. 'Frame: {}'), None for no label
+class PoseAnimation:
+    def __init__(self, num_frames, limits, view=(30, -90), title=None, fps=10, fig=None):
+        self.num_frames = num_frames
+        self.fps = fps
+        self.fig = plt.figure() if fig is None else fig
+        self.ax = self.fig.add_subplot(projection='3d')
+        self.layers = []
+        self.ani = None
+
+        ax = self.ax
+        if view is not None:
+            ax.view_init(elev=view[0], azim=view[1])
+        ax.set_xlim(*limits[0]); ax.set_ylim(*limits[1]); ax.set_zlim(*limits[2])
+        ax.set_xlabel("x", size = 14, weight = "light"); ax.set_ylabel("y", size = 14, weight = "light"); ax.set_zlabel("z", size = 14, weight = "light")
+        ax.set_autoscale_on(False)
+
+        ## drawn inside the axes, so that it is redrawn with the blitted artists
+        self.title_format = title
+        self.title = None if title is None else ax.text2D(0.5, 0.95, '', transform=ax.transAxes, ha='center')
+
+    ## add a stream to draw (see PoseLayer)
+    def addLayer(self, frames, bones=None, num_joints=None, **style):
+        layer = PoseLayer(self.ax, frames, bones, num_joints, **style)
+        self.layers.append(layer)
+        return layer
+
+    ## update all artists to frame fc, returns the updated artists
+    def update(self, fc):
+        artists = []
+        for layer in self.layers:
+            artists += layer.update(fc)
+
+        if self.title is not None:
+            self.title.set_text(self.title_format.format(fc))
+            artists.append(self.title)
+        return artists
+
+    def animate(self, blit=True):
+        self.ani = animation.FuncAnimation(self.fig, self.update, frames=self.num_frames, init_func=lambda: self.update(0),
+                                           interval=1000 / self.fps, blit=blit)
+        return self.ani
+
+    def show(self):
+        self.animate()
+        plt.show()
+
+    ## rgb images (height, width, 3) of the frames fcs. the figure without the poses is drawn once,
+    ## and each frame restores it and draws only the updated artists on it.
+    def renderFrames(self, fcs):
+        canvas = self.fig.canvas
+        artists = self.update(fcs[0])
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.draw()
+        background = canvas.copy_from_bbox(self.fig.bbox)
+
+        for fc in fcs:
+            canvas.restore_region(background)
+            for artist in self.update(fc):
+                self.fig.draw_artist(artist)
+            yield np.asarray(canvas.buffer_rgba())[..., :3].copy()
+
+        for artist in artists:
+            artist.set_animated(False)
+
+    ## export the animation (gif, or mp4 etc. with ffmpeg), see writeFrames
+    def save(self, path, fps=None, fcs=None):
+        fps = self.fps if fps is None else fps
+        fcs = range(self.num_frames) if fcs is None else fcs
+        writeFrames(path, self.renderFrames(fcs), fps)
+
+
+## -----------------##
+## export
+## -----------------##
+
+## gif of rgb images by Pillow. all frames share the palette of the first one (quantized once),
+## so the palette optimization of Pillow, which costs more than the rendering, is skipped.
+def writeGif(path, images, fps):
+    from PIL import Image
+
+    images = iter(images)
+    first = Image.fromarray(next(images)).quantize(method=Image.Quantize.FASTOCTREE)
+    rest = (Image.fromarray(image).quantize(palette=first, dither=Image.Dither.NONE) for image in images)
+    first.save(path, save_all=True, append_images=rest, duration=1000 / fps, loop=0, optimize=False)
+
+## video (or gif) of rgb images, piped to ffmpeg as raw frames. gif gets a palette generated from all frames.
+def writeVideo(path, images, fps):
+    images = iter(images)
+    image = next(images)
+    height, width = image.shape[:2]
+    if path.endswith('.gif'):
+        output = ['-vf', 'split[a][b];[a]palettegen[p];[b][p]paletteuse', path]
+    else:
+        output = ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', path]
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', '-'] + output
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as ffmpeg:
+        ffmpeg.stdin.write(image.tobytes())
+        for image in images:
+            ffmpeg.stdin.write(image.tobytes())
+        ffmpeg.stdin.close()
+
+    if ffmpeg.returncode != 0:
+        raise RuntimeError('ffmpeg failed to write {}'.format(path))
+
+## write rgb images (an iterable, consumed once) by ffmpeg if it is installed, otherwise gif by Pillow.
+def writeFrames(path, images, fps):
+    if shutil.which('ffmpeg') is not None:
+        writeVideo(path, images, fps)
+    elif path.endswith('.gif'):
+        writeGif(path, images, fps)
+    else:
+        raise RuntimeError('ffmpeg is not found, export {} as gif instead.'.format(path))
@@ -0,0 +1,142 @@
+import os
+import json
+import numpy as np
+
+from getPoints import Mocap, Openpose3d
+from loadData import loadPose3dConfidence
+from frameSync import loadFrameSync, toMocapFrame, SYNC_FILE
+
+## mocap frame of the keyframe pair [m_fc, o_fc] is m_fc*SKIP_OPT_CAP_FRAME (same as getPly.py).
+## m_fc is rounded to this grid, so the exact synchronized mocap frame is kept as well (MOCAP_FRAME).
+SKIP_OPT_CAP_FRAME = 36
+
+## mapping of the MV-OpenPose frame fc to the optical motion capture frame (fc*SKIP + START), used
+## when the session has no results/framesync.json (check-framesync-by-xcorr.py)
+SKIP_SYNC_FRAME = 39
+SKIP_SYNC_FRAME_START = 2650
+
+MOCAP_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/opt-mocap',
+    'DATASET_FILE' : 'optmocap.trc',
+    'JOINT_IDX' : 29,
+}
+
+OPENPOSE_CONF = {
+    'DATASET_DIR_ROOT': 'input_data/mv-openpose/3dpose',
+    'JOINT_IDX' : 8,
+    'FRAME_NUM' : 750,
+    'ADJ_SCALE' : 0.9,
+    'ADJ_CENTER_Z': 0.012,
+}
+
+EXPORT_CONF = {
+    'EXPORT_DIR' : 'keyframes',
+    'NUM_KEYFRAMES' : 8,
+    'MIN_CONF' : 0.3,     # minimum mean detection confidence of a candidate frame
+    'CONF_WEIGHT' : 1.0,  # exponent of the confidence in the score (0: diversity only)
+}
+
+## pose descriptor (frames, joints*3): joints relative to the root joint and divided by the mean
+## distance from it, so that only the pose (not the position or the size) is compared.
+## undetected joints are set to zero. the root joint must be detected (see selectKeyframes).
+def getPoseFeatures(points, detected, root):
+    rel = points - points[:, root:root + 1]
+    rel[~detected] = 0
+    count = np.maximum(np.sum(detected, axis=1), 1)
+    size = np.sum(np.linalg.norm(rel, axis=2), axis=1) / count
+    rel /= np.maximum(size, 1e-9)[:, None, None]
+    return rel.reshape(len(rel), -1)
+
+## farthest-point sampling of num frames in the feature space. each step picks the candidate with
+## the largest (distance to the nearest selected frame) * weight; the first pick is the best weight.
+##   features (frames, dims), weights (frames,), candidates (frames,) bool
+def sampleFarthest(features, weights, candidates, num):
+    if not np.any(candidates):
+        return np.array([], dtype=int)
+
+    score = np.where(candidates, weights, -np.inf)
+    selected = [int(np.argmax(score))]
+    min_dist = np.full(len(features), np.inf)
+
+    while len(selected) < min(num, np.sum(candidates)):
+        dist = np.linalg.norm(features - features[selected[-1]], axis=1)
+        min_dist = np.minimum(min_dist, dist)
+        score = np.where(candidates, min_dist * weights, -np.inf)
+        selected.append(int(np.argmax(score)))
+
+    return np.sort(selected)
+
+## keyframe pairs [[m_fc, o_fc], ...] of one session, and the exact mocap frame of each pair.
+## a candidate needs a detected root joint, enough detection confidence and all markers in its
+## paired mocap frame.
+def selectKeyframes(mocap, openpose, confidence, sync, configs):
+    op_frames = np.arange(min(OPENPOSE_CONF['FRAME_NUM'], len(openpose.data)))
+    mc_frames = toMocapFrame(op_frames, sync)
+    m_fcs = np.rint(mc_frames / SKIP_OPT_CAP_FRAME).astype(int)
+    in_range = (mc_frames >= 0) & (mc_frames < len(mocap.data))
+
+    points = openpose.loadFrames(op_frames)
+    detected = np.any(openpose.data[op_frames] != 0, axis=2)
+    conf = np.where(detected, confidence[op_frames], 0)
+    quality = np.mean(conf, axis=1)
+
+    complete = np.zeros(len(op_frames), dtype=bool)
+    complete[in_range] = np.all(np.isfinite(mocap.data[mc_frames[in_range]]), axis=(1, 2))
+
+    root = OPENPOSE_CONF['JOINT_IDX']
+    candidates = in_range & complete & detected[:, root] & (quality >= configs['MIN_CONF'])
+    features = getPoseFeatures(points, detected, root)
+    selected = sampleFarthest(features, quality ** configs['CONF_WEIGHT'], candidates, configs['NUM_KEYFRAMES'])
+
+    return [[int(m_fcs[fc]), int(fc)] for fc in selected], [int(mc_frames[fc]) for fc in selected]
+
+## main
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('roots', help='session directories (containing input_data and keyframes)', nargs='*', default=['.'])
+    parser.add_argument('-n', '--num', help='number of keyframes', type=int, default=EXPORT_CONF['NUM_KEYFRAMES'])
+    parser.add_argument('--min_conf', help='minimum mean detection confidence of a keyframe', type=float, default=EXPORT_CONF['MIN_CONF'])
+    parser.add_argument('--conf_weight', help='weight of the detection confidence against the pose diversity', type=float, default=EXPORT_CONF['CONF_WEIGHT'])
+    parser.add_argument('--skip', help='mocap frames per openpose frame (default: results/framesync.json of the session)', type=float)
+    parser.add_argument('--start', help='mocap frame of the first openpose frame (default: results/framesync.json of the session)', type=float)
+    parser.add_argument('--export', help='also export the keyframe ply files (same as select-keyframes.py)', action='store_true')
+    args = parser.parse_args()
+
+    configs = dict(EXPORT_CONF, NUM_KEYFRAMES=args.num, MIN_CONF=args.min_conf, CONF_WEIGHT=args.conf_weight)
+
+    for root in args.roots:
+        mocap_conf = dict(MOCAP_CONF, DATASET_DIR_ROOT=os.path.join(root, MOCAP_CONF['DATASET_DIR_ROOT']))
+        openpose_conf = dict(OPENPOSE_CONF, DATASET_DIR_ROOT=os.path.join(root, OPENPOSE_CONF['DATASET_DIR_ROOT']))
+        export_dir = os.path.join(root, EXPORT_CONF['EXPORT_DIR'])
+
+        mocap = Mocap(mocap_conf)
+        mocap.importData()
+        openpose = Openpose3d(openpose_conf)
+        confidence = loadPose3dConfidence(openpose_conf['DATASET_DIR_ROOT'])
+        sync = loadFrameSync({'skip': SKIP_SYNC_FRAME, 'start': SKIP_SYNC_FRAME_START}, os.path.join(root, SYNC_FILE))
+        if args.skip is not None:
+            sync['skip'] = args.skip
+        if args.start is not None:
+            sync['start'] = args.start
+
+        frame_num, mocap_frame = selectKeyframes(mocap, openpose, confidence, sync, configs)
+        print(root, 'FRAME_NUM:', frame_num, 'MOCAP_FRAME:', mocap_frame)
+
+        ## pairs in the formats of select-keyframes.py (FRAME_NUM) and check-framesync-by-icp.py (FRAME_CONF),
+        ## and the exact mocap frames of the pairs (MOCAP_FRAME)
+        os.makedirs(export_dir, exist_ok=True)
+        with open(os.path.join(export_dir, 'keyframes.json'), mode='w') as f:
+            json.dump({
+                'FRAME_NUM': frame_num,
+                'MOCAP_IDX': [m_fc for m_fc, o_fc in frame_num],
+                'OP_IDX': [o_fc for m_fc, o_fc in frame_num],
+                'MOCAP_FRAME': mocap_frame,
+            }, f, indent=1)
+
+        if args.export:
+            from getPly import GetPly
+            os.makedirs(os.path.join(export_dir, 'opt-mocap'), exist_ok=True)
+            os.makedirs(os.path.join(export_dir, 'mv-openpose'), exist_ok=True)
+            GetPly(mocap_conf, openpose_conf, {'EXPORT_DIR': export_dir, 'FRAME_NUM': frame_num, 'MOCAP_FRAME': mocap_frame}, batch=True)
@@ -1,10 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import mpl_toolkits.mplot3d.art3d as art3d
 
 from compScale import GetScale_OpenPose, GetScale_MoCap
 from getPoints import Mocap, Openpose3d
-from getPly import GetPly
+from skeleton import BONES_OPENPOSE, NUM_JOINTS_MOCAP, NUM_JOINTS_OPENPOSE, getBoneColors
+from poseAnimation import PoseAnimation, FrameCache
+from getPly import GetPly, SKIP_OPT_CAP_FRAME
 
 mocap_conf = {
     'DATASET_DIR_ROOT': 'input_data/opt-mocap',
@@ -25,6 +26,14 @@ export_conf = {
     'FRAME_NUM' : [[0,0]]  # Do not change the parameters.
 }
 
+## frames kept in memory per stream, frames read ahead of the slider,
+## and the delay (ms) in which slider events are coalesced into one redraw.
+viewer_conf = {
+    'CACHE_FRAMES' : 512,
+    'READ_AHEAD' : 32,
+    'DEBOUNCE_MS' : 30,
+}
+
 ## set scale.
 openpose_scale, openpose_center = GetScale_OpenPose(openpose_conf)
 mocap_scale, mocap_center = GetScale_MoCap(mocap_conf)
@@ -34,45 +43,39 @@ tmp = [openpose_scale, openpose_center]
 openpose_scale = tmp[0] * openpose_conf['ADJ_SCALE']
 openpose_center[2] = tmp[1][2] + openpose_conf['ADJ_CENTER_Z']
 
-def scalize(scale, x, y, z):
-    return x / scale, y / scale, z / scale
-
-def centerlize(scale, c, x, y, z):
-    c_x, c_y, c_z = scalize(scale, c[0], c[1], c[2])
-    return x - c_x, y - c_y, z - c_z
-
-
 ## main()
 mocap = Mocap(mocap_conf)
 mocap.importData()
 openpose = Openpose3d(openpose_conf)
 
-## draw 3d pose point 
-fig = plt.figure()
-ax = fig.gca(projection='3d')
+## normalized mocap frames of the keyframe numbers m_fcs (frames out of range are NaN)
+def loadMocapFrames(m_fcs):
+    mc_frames = m_fcs * SKIP_OPT_CAP_FRAME
+    valid = (mc_frames >= 0) & (mc_frames < len(mocap.data))
+    points = np.full((len(m_fcs), NUM_JOINTS_MOCAP, 3), np.nan)
+    points[valid] = mocap.loadFrames(mc_frames[valid])
+    return (points - mocap_center) / mocap_scale
+
+def loadOpenposeFrames(o_fcs):
+    return (openpose.loadFrames(o_fcs) - openpose_center) / openpose_scale
+
+mocap_frames = FrameCache(loadMocapFrames, -(-len(mocap.data) // SKIP_OPT_CAP_FRAME), viewer_conf['CACHE_FRAMES'], viewer_conf['READ_AHEAD'])
+openpose_frames = FrameCache(loadOpenposeFrames, openpose_conf['FRAME_NUM'], viewer_conf['CACHE_FRAMES'], viewer_conf['READ_AHEAD'])
+
+## draw 3d pose point, the artists are created once and only their data is updated.
+anim = PoseAnimation(openpose_conf['FRAME_NUM'], limits=((-2, 2), (-2.5, 2.5), (-1, 1)), view=None)
+mocap_layer = anim.addLayer(mocap_frames)
+openpose_layer = anim.addLayer(openpose_frames, BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, bone_colors=getBoneColors(len(BONES_OPENPOSE)))
+shown = None
 
 def update_frame(m_fc, o_fc):
-    ax.clear()
-    #ax.view_init(elev=30, azim=-90)
-    ax.set_xlim(-2, 2); ax.set_ylim(-2.5, 2.5); ax.set_zlim(-1, 1)
-    ax.set_xlabel("x", size = 14, weight = "light"); ax.set_ylabel("y", size = 14, weight = "light"); ax.set_zlabel("z", size = 14, weight = "light")
-
-    ## visualize mocap points
-    X, Y, Z = mocap.loadPoints(int(m_fc*36))
-    X, Y, Z = scalize(mocap_scale, X, Y, Z)
-    X, Y, Z = centerlize(mocap_scale, mocap_center, X, Y, Z)
-    ax.plot(X, Y, Z, 'k.')
-
-    ## visualize openpose3d points
-    X, Y, Z = openpose.loadPoints(o_fc)
-    X, Y, Z = scalize(openpose_scale, X, Y, Z)
-    X, Y, Z = centerlize(openpose_scale, openpose_center, X, Y, Z)
-    ax.plot(X, Y, Z, 'k.')
-
-    X, Y, Z = openpose.setLines(X, Y, Z)
-    for i, (x, y, z) in enumerate(zip(X, Y, Z)):
-        line = art3d.Line3D(x, y, z, color=plt.cm.jet(255//len(Openpose3d._BonesV2)*i))
-        ax.add_line(line)
+    global shown
+    if shown == (m_fc, o_fc):
+        return
+    shown = (m_fc, o_fc)
+
+    mocap_layer.update(m_fc)
+    openpose_layer.update(o_fc)
 
     #plt.show()
     plt.pause(.01)
@@ -150,15 +153,31 @@ def exportply():
     _ = GetPly(mocap_conf, openpose_conf, export_conf)
     print(f"exported successfully!")
 
+## slider events are coalesced: a redraw is scheduled once and draws the latest position of the sliders,
+## the events in between only move the read-ahead of the caches.
+redraw = None
+
+def request_frame():
+    global redraw
+    mocap_frames.prefetch(int(val2.get()))
+    openpose_frames.prefetch(int(val1.get()))
+    if redraw is None:
+        redraw = root.after(viewer_conf['DEBOUNCE_MS'], draw_latest)
+
+def draw_latest():
+    global redraw
+    redraw = None
+    update_frame(int(val2.get()), int(val1.get()))
+
 def sync_e1(val):
     e1.delete(0, END)
     e1.insert(END, int(val))
-    update_frame(int(val2.get()), int(val1.get()))
+    request_frame()
 
 def sync_e2(val):
     e2.delete(0, END)
     e2.insert(END, int(val))
-    update_frame(int(val2.get()), int(val1.get()))
+    request_frame()
 
 button_execute = ttk.Button(frame, text="visualize", command=setParam)
 button_execute.grid(row=4, column=1)
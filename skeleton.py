@@ -0,0 +1,73 @@
+import numpy as np
+
+## -----------------##
+## topology
+## -----------------##
+
+## bones of MV-OpenPose (BODY_25), pairs of joint indices
+BONES_OPENPOSE = np.array([
+    #NECK
+    [1,0],[1,8],[1,2],[1,5],
+    #HEAD
+    [0,15],[15,16],[0,17],[17,18],
+    #CROTCH
+    [8,9],[8,12],
+    #LEFT-ARM
+    [2,3],[3,4],
+    #RIGHT-ARM
+    [5,6],[6,7],
+    #LEFT-LEG
+    [9,10],[10,11],[11,22],[11,23],[11,24],
+    #RIGHT-LEG
+    [12,13],[13,14],[14,19],[14,20],[14,21]
+], dtype=int)
+NUM_JOINTS_OPENPOSE = 25
+
+## bones of the optical motion capture markers, pairs of marker indices
+BONES_MOCAP = np.array([
+    #HEAD
+    [0,1],[0,2],[1,3],[2,3],
+    #CROTCH
+    [2,24],[3,24],[22,23],[22,24],[24,25],[25,26],[26,27],[27,28],[23,29],[29,32],[29,33],
+    #LEFT-ARM
+    [25,15],[13,14],[14,15],[22,13],[15,16],[16,17],[13,18],[17,20],[18,19],[19,21],[20,21],
+    #RIGHT-ARM
+    [25,6],[4,5],[5,6],[22,4],[6,7],[7,8],[4,9],[9,10],[8,11],[10,12],[11,12],
+    #WAIST
+    [30,31],[30,32],[31,33],[32,33],
+    #LEFT-LEG
+    [31,48],[33,48],[31,49],[33,49],[48,50],[49,51],[50,52],[51,53],[53,54],[54,55],[52,55],
+    #LEFT-FOOT
+    [55,56],[56,57],[55,58],[58,59],[59,60],[58,61],
+    #RIGHT-LEG
+    [30,34],[32,34],[30,35],[34,36],[35,37],[36,38],[37,39],[39,40],[38,41],[40,41],
+    #RIGHT-FOOT
+    [41,42],[41,43],[41,44],[44,45],[45,46],[44,47]
+], dtype=int)
+NUM_JOINTS_MOCAP = 62
+
+
+## -----------------##
+## segments
+## -----------------##
+
+## (frames*bones, 2, 3) end points of the bones, gathered at once.
+##   points: (frames, joints, 3) or the frames concatenated as (frames*joints, 3)
+def getSegments(points, bones, num_joints):
+    points = np.asarray(points).reshape(-1, num_joints, 3)
+    return points[:, bones].reshape(-1, 2, 3)
+
+## segments split to lineX, lineY, lineZ (frames*bones, 2), the form of art3d.Line3D
+def getLines(X, Y, Z, bones, num_joints):
+    segments = getSegments(np.stack([X, Y, Z], axis=-1), bones, num_joints)
+    return segments[:, :, 0], segments[:, :, 1], segments[:, :, 2]
+
+## rgba colors (frames*bones, 4), a jet color per bone repeated in each frame
+def getBoneColors(num_bones, num_frames=1):
+    from matplotlib import cm
+    return np.tile(cm.jet(255 // num_bones * np.arange(num_bones)), (num_frames, 1))
+
+## all segments as a single artist (add it with ax.add_collection3d)
+def makeLineCollection(segments, colors, **kwargs):
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+    return Line3DCollection(segments, colors=colors, **kwargs)
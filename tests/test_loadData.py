@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from loadData import parseTrcRows
+
+## trc body of 2 markers (Frame#, Time, X1, Y1, Z1, X2, Y2, Z2), tab separated as exported
+ROWS = [
+    '1\t0.00\t1\t2\t3\t4\t5\t6',
+    '2\t0.01\t1\t2\t3',          ## the last marker is missing (row cut short)
+    '3\t0.02\t\t\t\t4\t5\t6',    ## the first marker is missing (empty fields)
+]
+
+def test_short_row_is_padded_with_nan():
+    points = parseTrcRows(ROWS, 'test.trc')
+    assert points.shape == (3, 2, 3)
+    assert points[0].tolist() == [[1, 2, 3], [4, 5, 6]]
+    assert points[1, 0].tolist() == [1, 2, 3] and np.all(np.isnan(points[1, 1]))
+    assert np.all(np.isnan(points[2, 0])) and points[2, 1].tolist() == [4, 5, 6]
+
+## the columns are those of the first row of the body, also for the rows of later chunks
+def test_columns_of_the_body():
+    points = parseTrcRows(ROWS[1:2], 'test.trc', numColumns=8, start=1)
+    assert points.shape == (1, 2, 3) and np.all(np.isnan(points[0, 1]))
+
+def test_broken_rows_are_named():
+    with pytest.raises(ValueError, match='frame 1 of the trc body is not numeric'):
+        parseTrcRows([ROWS[0], '2\t0.01\t1\tx\t3\t4\t5\t6'], 'test.trc')
+    with pytest.raises(ValueError, match='frame 4097 of the trc body has 9 columns, expected 8'):
+        parseTrcRows([ROWS[0], ROWS[0] + '\t7'], 'test.trc', numColumns=8, start=4096)
@@ -0,0 +1,77 @@
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+
+from plyFile import PLY_DTYPE, makeVertices, writePly, readPly, readHeader, loadPlyPoints, getFramePair, readKeyframeBlocks
+
+## make-keyframes-plysets.py is a script, load it as a module (its main part does not run)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location('make_keyframes_plysets', os.path.join(ROOT, 'make-keyframes-plysets.py'))
+plysets = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(plysets)
+
+def makePoints(num, seed):
+    return np.random.default_rng(seed).normal(size=(num, 3)).astype('f4')
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_round_trip(tmp_path, binary):
+    path = str(tmp_path / 'points.ply')
+    vertices = makeVertices(makePoints(25, 0), (0, 0, 255))
+    writePly(path, vertices, binary=binary, comments=['frame_pair 163 78'])
+
+    with open(path, mode='rb') as f:
+        fmt, num_vertex, dtype, comments = readHeader(f)
+    assert fmt == ('binary_little_endian' if binary else 'ascii')
+    assert num_vertex == 25
+    assert getFramePair(comments) == [163, 78]
+
+    assert np.array_equal(readPly(path), vertices)
+    assert np.array_equal(loadPlyPoints(path), vertices[['x', 'y', 'z']].tolist())
+    if binary:
+        assert np.array_equal(readPly(path, mmap=True), vertices)
+
+def writeHeader(path, lines):
+    with open(path, mode='wb') as f:
+        f.write(('\n'.join(lines) + '\n').encode('ascii'))
+
+def test_bare_comment_is_skipped(tmp_path):
+    path = str(tmp_path / 'points.ply')
+    writeHeader(path, ['ply', 'format ascii 1.0', 'comment', 'element vertex 1', 'property float x',
+                       'property float y', 'property float z', 'end_header', '1 2 3'])
+    with open(path, mode='rb') as f:
+        comments = readHeader(f)[3]
+    assert comments == []
+    assert getFramePair(comments) is None
+    assert readKeyframeBlocks(path) == []
+    assert loadPlyPoints(path).tolist() == [[1, 2, 3]]
+
+def test_missing_format(tmp_path):
+    path = str(tmp_path / 'points.ply')
+    writeHeader(path, ['ply', 'element vertex 1', 'property float x', 'end_header', '1'])
+    with pytest.raises(ValueError, match='format is missing'):
+        readPly(path)
+
+## keyframe files in both formats, one without a frame pair: the set lists the paired keyframes first
+## (in the order of the pairs) and records the offset, count and pair of each keyframe in its header.
+@pytest.mark.parametrize('binary', [True, False])
+def test_keyframe_blocks(tmp_path, binary):
+    dirname = str(tmp_path / 'mv-openpose')
+    os.makedirs(dirname)
+    points = [makePoints(25, 1), makePoints(25, 2), makePoints(10, 3)]
+    writePly(dirname + '/o_1.ply', makeVertices(points[0], (0, 0, 255)), binary=True, comments=['frame_pair 178 92'])
+    writePly(dirname + '/o_0.ply', makeVertices(points[1], (0, 0, 255)), binary=False, comments=['frame_pair 163 78'])
+    writePly(dirname + '/extra.ply', makeVertices(points[2], (0, 0, 255)), binary=True)
+
+    plysets.concatnate(dirname, binary=binary)
+
+    blocks = readKeyframeBlocks(dirname + '.ply')
+    assert blocks == [
+        {'offset': 0, 'count': 25, 'pair': [163, 78]},
+        {'offset': 25, 'count': 25, 'pair': [178, 92]},
+        {'offset': 50, 'count': 10, 'pair': None},
+    ]
+    vertices = readPly(dirname + '.ply')
+    assert vertices.dtype.names == PLY_DTYPE.names
+    assert np.array_equal(loadPlyPoints(dirname + '.ply'), np.concatenate([points[1], points[0], points[2]]))
@@ -0,0 +1,49 @@
+import os
+import importlib.util
+
+import numpy as np
+
+## check-framesync-by-icp.py is a script, load it as a module (its main part does not run)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location('check_framesync_by_icp', os.path.join(ROOT, 'check-framesync-by-icp.py'))
+framesync = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(framesync)
+
+## memoized cost curve with the interface of OffsetCost
+class CurveCost(object):
+    def __init__(self, curve):
+        self.curve = curve
+        self.costs = {}
+
+    def __call__(self, offsets):
+        for x in offsets:
+            self.costs.setdefault(int(x), self.curve(int(x)))
+        return np.array([self.costs[int(x)] for x in offsets])
+
+    def best(self):
+        return min(self.costs, key=self.costs.get)
+
+def test_golden_finds_exact_offset():
+    scope = framesync.FRAME_RANGE
+    for target in range(-scope, scope + 1):
+        for curve in (lambda x: (x - target) ** 2, lambda x: abs(x - target) ** 1.5 + 0.1 * (x - target)):
+            evaluate = CurveCost(curve)
+            assert framesync.searchGolden(evaluate, scope) == target
+            ## one new probe per step (a search evaluating both probes of every step needs about 21)
+            assert len(evaluate.costs) <= 14
+
+## keyframes of the true offset are the openpose points with noise, all other offsets are unrelated clouds.
+## the robust methods reject most pairs of the unrelated clouds, which must not make them cheaper.
+def test_robust_cost_prefers_aligned_offset():
+    rng = np.random.default_rng(0)
+    scope, target = framesync.FRAME_RANGE, 37
+    op_points = rng.uniform(size=(60, 3))
+    store = rng.uniform(size=(2 * scope + 1, 60, 3))
+    store[target + scope] = op_points + rng.normal(scale=0.02, size=op_points.shape)
+    framesync.mocap_store = store
+
+    offsets = range(-scope, scope + 1, 4)
+    for robust in ({'method': 'threshold', 'param': 0.05}, {'method': 'trim', 'param': 0.5}):
+        evaluate = framesync.OffsetCost(op_points, robust=robust)
+        evaluate(list(offsets) + [target])
+        assert evaluate.best() == target
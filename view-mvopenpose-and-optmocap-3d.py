@@ -1,15 +1,17 @@
 import datetime
 import numpy as np
 
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import mpl_toolkits.mplot3d.art3d as art3d
-
 from compScale import GetScale_OpenPose, GetScale_MoCap
 from getPoints import Mocap, Openpose3d
+from skeleton import BONES_OPENPOSE, NUM_JOINTS_MOCAP, NUM_JOINTS_OPENPOSE, getBoneColors
+from poseAnimation import PoseAnimation, FrameBlocks
+from frameSync import loadFrameSync, toMocapFrame
 
 SKIP_OPT_CAP_FRAME = 39
-SKIP_OPT_CAP_FRAME_START = 2700 
+SKIP_OPT_CAP_FRAME_START = 2700
+
+## results/framesync.json (check-framesync-by-xcorr.py) replaces the constants above, if it exists.
+FRAME_SYNC = loadFrameSync({'skip': SKIP_OPT_CAP_FRAME, 'start': SKIP_OPT_CAP_FRAME_START})
 
 mocap_conf = {
     'DATASET_DIR_ROOT': 'input_data/opt-mocap',
@@ -40,49 +42,32 @@ mocap_scale, mocap_center = GetScale_MoCap(mocap_conf)
 openpose_scale *= openpose_conf['ADJ_SCALE']
 openpose_center[2] += openpose_conf['ADJ_CENTER_Z']
 
-def scalize(scale, x, y, z):
-    return x / scale, y / scale, z / scale
-
-def centerlize(scale, c, x, y, z):
-    c_x, c_y, c_z = scalize(scale, c[0], c[1], c[2])
-    return x - c_x, y - c_y, z - c_z
-
 ## main()
 mocap = Mocap(mocap_conf)
 mocap.importData()
 
 openpose = Openpose3d(openpose_conf)
 
-## draw 3d pose point 
-fig = plt.figure()
-ax = fig.gca(projection='3d')
+## mocap frames synchronized with the openpose frames fc, normalized.
+## frames out of the mocap range are NaN (not drawn).
+def loadMocapFrames(fcs):
+    mc_frames = toMocapFrame(fcs, FRAME_SYNC)
+    valid = (mc_frames >= 0) & (mc_frames < len(mocap.data))
+    points = np.full((len(fcs), NUM_JOINTS_MOCAP, 3), np.nan)
+    points[valid] = mocap.loadFrames(mc_frames[valid])
+    return (points - mocap_center) / mocap_scale
 
-def update_frame(fc):
-    ax.clear()
-    ax.view_init(elev=30, azim=-90)
-    ax.set_xlim(-2, 2); ax.set_ylim(-2.5, 2.5); ax.set_zlim(-1, 1)
-    ax.set_xlabel("x", size = 14, weight = "light"); ax.set_ylabel("y", size = 14, weight = "light"); ax.set_zlabel("z", size = 14, weight = "light")
+## openpose frames fc, normalized
+def loadOpenposeFrames(fcs):
+    return (openpose.loadFrames(fcs) - openpose_center) / openpose_scale
 
-    ## visualize mocap points
-    X, Y, Z = mocap.loadPoints(int(fc*SKIP_OPT_CAP_FRAME+SKIP_OPT_CAP_FRAME_START))
-    X, Y, Z = scalize(mocap_scale, X, Y, Z)
-    X, Y, Z = centerlize(mocap_scale, mocap_center, X, Y, Z)
-    ax.plot(X, Y, Z, 'k.')
-
-    ## visualize openpose3d points
-    X, Y, Z = openpose.loadPoints(fc)
-    X, Y, Z = scalize(openpose_scale, X, Y, Z)
-    X, Y, Z = centerlize(openpose_scale, openpose_center, X, Y, Z)
-    ax.plot(X, Y, Z, 'k.')
-
-    X, Y, Z = openpose.setLines(X, Y, Z)
-    for i, (x, y, z) in enumerate(zip(X, Y, Z)):
-        line = art3d.Line3D(x, y, z, color=plt.cm.jet(255//len(Openpose3d._BonesV2)*i))
-        ax.add_line(line)
-
-ani = animation.FuncAnimation(fig, update_frame, frames=int(openpose_conf['FRAME_NUM']) , interval=100)
-plt.show()
+## draw 3d pose point 
+num_frames = int(openpose_conf['FRAME_NUM'])
+anim = PoseAnimation(num_frames, limits=((-2, 2), (-2.5, 2.5), (-1, 1)))
+anim.addLayer(FrameBlocks(loadMocapFrames, num_frames))
+anim.addLayer(FrameBlocks(loadOpenposeFrames, num_frames), BONES_OPENPOSE, NUM_JOINTS_OPENPOSE, bone_colors=getBoneColors(len(BONES_OPENPOSE)))
+anim.show()
 
 ## output gif animation file (optional)
 # videopath = '{}/movie_{}.gif'.format(export_conf["EXPORT_DIR"], datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S'))
-# ani.save(videopath, writer='PillowWriter', fps=10)
\ No newline at end of file
+# anim.save(videopath, fps=10)
\ No newline at end of file
@@ -2,8 +2,8 @@ import argparse
 import datetime
 import numpy as np
 
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from loadData import loadTrc
+from poseAnimation import PoseAnimation, FrameBlocks
 
 
 ## config (set path directly)
@@ -29,50 +29,19 @@ DATASET_DIR_ROOT = args.dir
 DATASET_FILE = args.file
 MOVIE_OUT_DIR = args.out
 
-## load dataset file
+## load dataset file, (frames, markers, 3)
 path = DATASET_DIR_ROOT + '/' + DATASET_FILE
-data = []
+data = loadTrc(path)
 
-with open(path) as f:
-    data = [s.strip() for s in f.readlines()]
-    
-    ## delete header
-    for i in range(6):
-        data.pop(0)
+## mocap frames per frame of the animation
+SKIP_FRAME = 30
 
-## load joint points
-def loadPoints(fc):
-    points = data[fc].split()
-    numJoints = (len(points) - 2) // 3
-
-    X = np.zeros(numJoints, dtype=float)
-    Y = np.zeros(numJoints, dtype=float)
-    Z = np.zeros(numJoints, dtype=float)
-    idx = 0; ct = 2
-    while ct < len(points):
-        X[idx] = float(points[ct]); ct += 1
-        Y[idx] = float(points[ct]); ct += 1
-        Z[idx] = float(points[ct]); ct += 1
-        idx += 1
-
-    return X, Y, Z
-
-## draw 3d pose point 
-fig = plt.figure()
-ax = fig.gca(projection='3d')
-
-def update_frame(fc):
-    ax.clear()
-    ax.view_init(elev=30, azim=-90)
-    ax.set_xlim(-2000, 2000); ax.set_ylim(-2500, 2500); ax.set_zlim(0, 2000)
-    ax.set_xlabel("x", size = 14, weight = "light"); ax.set_ylabel("y", size = 14, weight = "light"); ax.set_zlabel("z", size = 14, weight = "light")
-
-    X, Y, Z = loadPoints(fc*30)
-    ax.plot(X, Y, Z, 'k.')
-
-ani = animation.FuncAnimation(fig, update_frame, frames=len(data)//30, interval=33)
-plt.show()
+## draw 3d pose point, every SKIP_FRAME frame
+num_frames = len(data) // SKIP_FRAME
+anim = PoseAnimation(num_frames, limits=((-2000, 2000), (-2500, 2500), (0, 2000)), fps=30)
+anim.addLayer(FrameBlocks(lambda fcs: data[fcs * SKIP_FRAME], num_frames))
+anim.show()
 
 ## output gif animation file (optional)
 # videopath = '{}/movie_{}.gif'.format(MOVIE_OUT_DIR, datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S'))
-# ani.save(videopath, writer='PillowWriter', fps=60)
\ No newline at end of file
+# anim.save(videopath, fps=60)
\ No newline at end of file